@@ -5,18 +5,51 @@ Usage: bin/kdiff -c1 CONTEXT1 -c2 CONTEXT2 [options]
 """
 from __future__ import annotations
 import argparse
+import hashlib
+import http.client
+import io
 import json
 import os
+import platform
+import re
 import shutil
 import subprocess
 import sys
+import traceback
+import urllib.parse
 from pathlib import Path
-import importlib.util
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from threading import Lock
+import multiprocessing
+from functools import lru_cache
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+from threading import BoundedSemaphore, Event, Lock, Thread, local
+
+# Optional C JSON codec: much faster on large kubectl lists, stdlib json otherwise
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on environment
+    orjson = None
+
+# Optional YAML parser: lets kdiff read context names from kubeconfig without running kubectl
+try:
+    import yaml
+except ImportError:  # pragma: no cover - depends on environment
+    yaml = None
+
+# Optional streaming JSON parser: bounds memory to one item on very large list responses
+try:
+    import ijson
+except ImportError:  # pragma: no cover - depends on environment
+    ijson = None
+
+# kubectl responses above this size are parsed item by item (if ijson is available)
+STREAM_PARSE_THRESHOLD = 32 * 1024 * 1024
 
 # Import version from lib package
 from lib import __version__
+from lib import compare, diff_details, report
+from lib.compare import INDEX_NAME
 
 ROOT = Path(__file__).resolve().parent
 LIB = ROOT / 'lib'
@@ -32,6 +65,57 @@ SERVICE_INGRESS_RESOURCES = ['service', 'ingress']
 
 # All supported resources for reference
 ALL_SUPPORTED_RESOURCES = RESOURCES + VOLATILE_RESOURCES + SERVICE_INGRESS_RESOURCES
+# Same names as a set, for membership checks
+SUPPORTED_RESOURCE_SET = frozenset(ALL_SUPPORTED_RESOURCES)
+
+# Most types fetched by one combined kubectl call (--batch-resources)
+BATCH_MAX_KINDS = 4
+
+# Types whose lists are usually the largest (data payloads, many objects):
+# with --batch-resources they are spread over different combined calls
+LARGE_PAYLOAD_RESOURCES = ('secret', 'configmap', 'pod')
+
+# Relative cost of listing each type (payload size, object count), used to start
+# the slowest fetches first: they then overlap with all the cheap ones instead of
+# running alone at the end. Types not listed weigh 1.
+KIND_WEIGHT = {
+    'secret': 5, 'configmap': 4, 'pod': 4, 'replicaset': 3,
+    'deployment': 3, 'statefulset': 3, 'daemonset': 3, 'job': 3, 'cronjob': 2,
+}
+
+# Page size of cluster-wide list requests, through kubectl (--chunk-size) or the proxy (limit)
+API_CHUNK_SIZE = 500
+
+# Threads writing the fetched files, shared by all lists: normalizing the next items
+# overlaps with the write syscalls (os.write releases the GIL), which are slow on
+# network/overlay FS
+WRITE_WORKERS = 4
+WRITE_EXECUTOR = ThreadPoolExecutor(max_workers=WRITE_WORKERS, thread_name_prefix='kdiff-write')
+
+# Writes queued or running at once, across all lists: when the disk is slower than
+# normalization, fetch threads wait here instead of piling serialized files in memory
+WRITE_QUEUE_LIMIT = 64
+WRITE_SLOTS = BoundedSemaphore(WRITE_QUEUE_LIMIT)
+
+# REST endpoints of the supported resources (apiVersion, Kind, plural), used with --api-proxy
+RESOURCE_API = {
+    'deployment': ('apps/v1', 'Deployment', 'deployments'),
+    'statefulset': ('apps/v1', 'StatefulSet', 'statefulsets'),
+    'daemonset': ('apps/v1', 'DaemonSet', 'daemonsets'),
+    'replicaset': ('apps/v1', 'ReplicaSet', 'replicasets'),
+    'configmap': ('v1', 'ConfigMap', 'configmaps'),
+    'secret': ('v1', 'Secret', 'secrets'),
+    'persistentvolumeclaim': ('v1', 'PersistentVolumeClaim', 'persistentvolumeclaims'),
+    'serviceaccount': ('v1', 'ServiceAccount', 'serviceaccounts'),
+    'service': ('v1', 'Service', 'services'),
+    'pod': ('v1', 'Pod', 'pods'),
+    'role': ('rbac.authorization.k8s.io/v1', 'Role', 'roles'),
+    'rolebinding': ('rbac.authorization.k8s.io/v1', 'RoleBinding', 'rolebindings'),
+    'horizontalpodautoscaler': ('autoscaling/v2', 'HorizontalPodAutoscaler', 'horizontalpodautoscalers'),
+    'cronjob': ('batch/v1', 'CronJob', 'cronjobs'),
+    'job': ('batch/v1', 'Job', 'jobs'),
+    'ingress': ('networking.k8s.io/v1', 'Ingress', 'ingresses'),
+}
 
 GREEN = '\033[0;32m'
 YELLOW = '\033[0;33m'
@@ -64,8 +148,49 @@ def check_deps():
         sys.exit(2)
 
 
+def read_kubeconfig_contexts() -> list[str] | None:
+    """
+    Read context names directly from the kubeconfig files ($KUBECONFIG or ~/.kube/config).
+    
+    Returns:
+        List of context names, or None if they cannot be read (PyYAML missing,
+        no kubeconfig file, parse error) and kubectl must be asked instead
+    """
+    if yaml is None:
+        return None
+    
+    # Same lookup as kubectl: KUBECONFIG is a list of files merged in order
+    paths = [p for p in os.environ.get('KUBECONFIG', '').split(os.pathsep) if p]
+    if not paths:
+        paths = [str(Path.home() / '.kube' / 'config')]
+    
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    contexts = []
+    found = False
+    for p in paths:
+        path = Path(p).expanduser()
+        if not path.is_file():
+            continue
+        try:
+            with open(path, encoding='utf-8') as fh:
+                doc = yaml.load(fh, Loader=loader)
+            for ctx in (doc or {}).get('contexts') or []:
+                name = ctx.get('name')
+                if name and name not in contexts:
+                    contexts.append(name)
+        except (OSError, yaml.YAMLError, AttributeError, TypeError):
+            return None
+        found = True
+    
+    return contexts if found else None
+
+
 def get_available_contexts():
     """Get list of available kubectl contexts."""
+    # Parsing kubeconfig directly avoids a kubectl process (slow with large kubeconfigs)
+    contexts = read_kubeconfig_contexts()
+    if contexts is not None:
+        return contexts
     try:
         proc = subprocess.run(['kubectl', 'config', 'get-contexts', '-o', 'name'], 
                             capture_output=True, text=True, check=True)
@@ -108,9 +233,10 @@ def test_cluster_connectivity(context: str, namespaces: list[str] | None = None)
             test_ns = None
         
         if test_ns:
-            # Use 'kubectl get ns' to test connectivity - works with namespace-scoped access
+            # Use 'kubectl auth can-i' to test connectivity - works with namespace-scoped access
+            # and is a single small API call (no pod list transferred)
             proc = subprocess.run(
-                ['kubectl', '--context', context, 'get', 'pods', '-n', test_ns, '--request-timeout=10s', '-o', 'name'],
+                kubectl_cmd(context, 'auth', 'can-i', 'get', 'pods', '-n', test_ns, '--request-timeout=10s'),
                 capture_output=True,
                 text=True,
                 timeout=15
@@ -118,7 +244,7 @@ def test_cluster_connectivity(context: str, namespaces: list[str] | None = None)
         else:
             # Try to get cluster info - requires cluster-level permissions
             proc = subprocess.run(
-                ['kubectl', '--context', context, 'cluster-info', '--request-timeout=10s'],
+                kubectl_cmd(context, 'cluster-info', '--request-timeout=10s'),
                 capture_output=True,
                 text=True,
                 timeout=15
@@ -129,19 +255,23 @@ def test_cluster_connectivity(context: str, namespaces: list[str] | None = None)
         
         # Parse error to provide helpful message
         stderr = proc.stderr.strip()
-        if 'does not exist' in stderr:
+        if test_ns and not stderr and proc.stdout.strip() == 'no':
+            # can-i answered: the cluster is reachable but the namespace is not readable
+            return False, f"Access denied to namespace '{test_ns}' in cluster '{context}' - check RBAC permissions"
+        stderr_lower = stderr.casefold()
+        if 'does not exist' in stderr_lower:
             return False, f"Context '{context}' does not exist in kubeconfig"
-        elif 'no such host' in stderr or 'dial tcp' in stderr:
+        elif 'no such host' in stderr_lower or 'dial tcp' in stderr_lower:
             return False, f"Unable to connect to cluster '{context}' - cluster unreachable (check DNS/network/VPN)"
-        elif 'timeout' in stderr.lower() or 'timed out' in stderr.lower():
+        elif 'timeout' in stderr_lower or 'timed out' in stderr_lower:
             return False, f"Connection timeout to cluster '{context}' - cluster may be down or unreachable"
-        elif 'Forbidden' in stderr or 'forbidden' in stderr:
+        elif 'forbidden' in stderr_lower:
             # If testing with namespace and got Forbidden, might not have access to that namespace
             if test_ns:
                 return False, f"Access denied to namespace '{test_ns}' in cluster '{context}' - check RBAC permissions"
             else:
                 return False, f"Insufficient cluster-level permissions for '{context}' - this may be normal if you have only namespace-scoped access"
-        elif 'Unauthorized' in stderr or 'unauthorized' in stderr:
+        elif 'unauthorized' in stderr_lower:
             return False, f"Authentication failed for cluster '{context}' - check credentials"
         else:
             return False, f"Unable to connect to cluster '{context}': {stderr[:200]}"
@@ -155,17 +285,38 @@ def test_cluster_connectivity(context: str, namespaces: list[str] | None = None)
 
 
 def cleanup_output_dir(outdir: Path):
-    """Clean output directory if it already exists."""
+    """
+    Clean output directory if it already exists.
+    
+    A previous run leaves thousands of small files: the directory is renamed out
+    of the way (instant) and deleted by a background thread while the new run
+    starts fetching. The thread is not a daemon, so the deletion completes
+    before the process exits.
+    """
     if outdir.exists():
+        trash = outdir.with_name(f"{outdir.name}.rm-{os.getpid()}")
         try:
-            shutil.rmtree(outdir)
+            outdir.rename(trash)
+        except OSError:
+            # Not renamable (e.g. a mount point): delete it in place
+            trash = None
+        try:
+            if trash is None:
+                shutil.rmtree(outdir)
+            else:
+                Thread(target=shutil.rmtree, args=(trash,), kwargs={'ignore_errors': True}, name='kdiff-cleanup').start()
             print(f"Cleaning existing output directory: {outdir}")
         except Exception as e:
             print(f"Warning: Unable to clean {outdir}: {e}", file=sys.stderr)
 
 
+# Command opening a file with its default application, per OS (None if unknown)
+OPEN_COMMAND = {'Darwin': 'open', 'Linux': 'xdg-open', 'Windows': 'start'}.get(platform.system())
+
+
+@lru_cache(maxsize=1)
 def is_running_in_docker() -> bool:
-    """Detect if the script is running inside a Docker container."""
+    """Detect if the script is running inside a Docker container (checked once per process)."""
     # Check for .dockerenv file (most reliable)
     if os.path.exists('/.dockerenv'):
         return True
@@ -186,45 +337,511 @@ def open_html_in_browser(html_path: Path) -> bool:
     Skips opening if running in Docker container or if KDIFF_NO_BROWSER env var is set.
     """
     # Skip browser opening in Docker environment or if disabled via env var
-    if is_running_in_docker() or os.getenv('KDIFF_NO_BROWSER'):
+    # (env var first: it avoids the Docker checks' file reads)
+    if os.getenv('KDIFF_NO_BROWSER') or is_running_in_docker():
+        return False
+    
+    if OPEN_COMMAND is None:
         return False
     
     # Convert to absolute path
     abs_path = html_path.resolve()
     
-    import platform
     try:
-        system = platform.system()
-        if system == 'Darwin':  # macOS
-            subprocess.run(['open', str(abs_path)], check=True)
-        elif system == 'Linux':
-            subprocess.run(['xdg-open', str(abs_path)], check=True)
-        elif system == 'Windows':
-            subprocess.run(['start', str(abs_path)], shell=True, check=True)
-        else:
-            return False
+        # 'start' is a cmd.exe builtin, not an executable
+        subprocess.run([OPEN_COMMAND, str(abs_path)], shell=(OPEN_COMMAND == 'start'), check=True)
         return True
     except Exception:
         return False
 
 
-# dynamic import helper to load normalize.normalize
-def load_normalize_func():
-    spec = importlib.util.spec_from_file_location('normalize', str(LIB / 'normalize.py'))
-    mod = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(mod)  # type: ignore
-    return getattr(mod, 'normalize')
+def show_html_report(html_path: Path):
+    """Open the HTML report in the browser, or print the OS-specific command to open it."""
+    if open_html_in_browser(html_path):
+        print(f"{GREEN}Opening report in browser...{RESET}")
+    else:
+        # Use the path as-is (it's already relative to output dir)
+        print(f"{YELLOW}Open manually: {OPEN_COMMAND or '<browser>'} {html_path}{RESET}")
 
 
-# dynamic import helper to load normalize.normalize
+@contextmanager
+def buffered_stdout():
+    """
+    Block-buffer stdout for an output-only phase (e.g. the console report).
+    
+    On a terminal stdout is line-buffered, so every printed line is one write
+    syscall; the report prints hundreds of them. Lines are written in large
+    blocks instead and flushed once at the end of the phase. Progress output
+    (fetch status lines mixed with stderr warnings) keeps line buffering.
+    """
+    if not getattr(sys.stdout, 'line_buffering', False) or not hasattr(sys.stdout, 'reconfigure'):
+        yield
+        return
+    sys.stdout.reconfigure(line_buffering=False)
+    try:
+        yield
+    finally:
+        # reconfigure() flushes the pending output
+        sys.stdout.reconfigure(line_buffering=True)
+
+
+def default_max_workers() -> int:
+    """Default number of fetch threads: KDIFF_FETCH_WORKERS if set to a positive integer, else 10."""
+    try:
+        return max(1, int(os.getenv('KDIFF_FETCH_WORKERS', '10')))
+    except ValueError:
+        return 10
+
+
+def output_text(output: bytes | str | None) -> str:
+    """Return captured subprocess output as text (kubectl output is captured as bytes)."""
+    if isinstance(output, bytes):
+        return output.decode('utf-8', errors='replace')
+    return output or ''
+
+
+def load_json(data: bytes | str):
+    """
+    Parse kubectl JSON output (bytes or str), using orjson when available.
+    
+    orjson is limited to 64-bit integers, which covers every Kubernetes API field (int64).
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dump_json(obj, pretty: bool = False) -> bytes:
+    """
+    Serialize a normalized resource as canonical UTF-8 JSON bytes (sorted keys, trailing newline).
+    
+    Fetched files are compact by default: compare.py re-formats them before diffing
+    and the HTML report pretty-prints them for display, so indentation would only
+    add size and write time. pretty=True adds a 2-space indent for human reading.
+    
+    orjson produces the same layout as json.dumps(sort_keys=True, ensure_ascii=False),
+    apart from the exponent notation of some floats. Objects it cannot encode
+    (e.g. integers beyond 64 bit) fall back to the stdlib.
+    """
+    if orjson is not None:
+        option = orjson.OPT_SORT_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        try:
+            return orjson.dumps(obj, option=option) + b"\n"
+        except TypeError:
+            pass
+    if pretty:
+        text = json.dumps(obj, sort_keys=True, indent=2, ensure_ascii=False)
+    else:
+        text = json.dumps(obj, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return (text + "\n").encode('utf-8')
+
+
+def iter_list_items(output: bytes | str):
+    """
+    Yield the 'items' of a kubectl List response one at a time.
+    
+    Large responses are streamed with ijson (when installed), so only one item is
+    materialized at a time instead of the whole parsed list. Smaller responses are
+    parsed in one go and their items released as they are consumed.
+    
+    Args:
+        output: Raw 'kubectl get -o json' output
+    """
+    if not output.strip():
+        return
+    if ijson is not None and len(output) > STREAM_PARSE_THRESHOLD:
+        if isinstance(output, str):
+            output = output.encode('utf-8')
+        # use_float: keep numbers as float like json.loads (ijson defaults to Decimal)
+        yield from ijson.items(io.BytesIO(output), 'items.item', use_float=True)
+        return
+    items = load_json(output).get('items', [])
+    # Drop the raw response once parsed: only the item tree is needed from here on
+    del output
+    # Pop items as they are yielded so each object is freed once written
+    while items:
+        yield items.pop()
+
+
+# Fields of each list item that normalize() always drops: the REST API returns them
+# (kubectl strips managedFields client-side), but they are skipped while parsing.
+# The last-applied annotation is a full JSON copy of the object as a string.
+DISCARDED_FIELDS = frozenset({
+    'items.item.status',
+    'items.item.metadata.managedFields',
+    'items.item.metadata.annotations.kubectl.kubernetes.io/last-applied-configuration',
+})
+DISCARDED_PREFIXES = tuple(f"{field}." for field in sorted(DISCARDED_FIELDS))
+
+
+def iter_list_stream(stream, meta: dict):
+    """
+    Yield the 'items' of a List response read incrementally from a binary stream.
+    
+    Items are built from ijson parse events as the bytes arrive, so neither the raw
+    body nor the whole item list is ever held in memory. The list continue token
+    (metadata.continue) is stored in meta['continue'] when present.
+    """
+    builder = None
+    # use_float: keep numbers as float like json.loads (ijson defaults to Decimal)
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if builder is not None:
+            # Never build the subtrees that normalize() discards anyway
+            if (prefix in DISCARDED_FIELDS or prefix.startswith(DISCARDED_PREFIXES)
+                    or (event == 'map_key' and f"{prefix}.{value}" in DISCARDED_FIELDS)):
+                continue
+            builder.event(event, value)
+            if prefix == 'items.item' and event == 'end_map':
+                yield builder.value
+                builder = None
+        elif prefix == 'items.item' and event == 'start_map':
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+        elif prefix == 'metadata.continue' and event == 'string':
+            meta['continue'] = value
+
+
+def run_kubectl_streamed(cmd: list[str], consume) -> tuple[int, int, bytes]:
+    """
+    Run a 'kubectl get -o json' command and parse its list items from the pipe.
+    
+    Items are decoded by ijson as kubectl writes them and handed to consume
+    (e.g. write_items), so neither the raw output nor the whole list is ever held
+    in memory. stderr is drained by a thread so a chatty kubectl cannot block on
+    a full pipe.
+    
+    Returns:
+        (consume's result, kubectl exit code, stderr bytes); the result is 0 when
+        kubectl failed without printing a list
+    """
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=1024 * 1024)
+    stderr = []
+    drain = Thread(target=lambda: stderr.append(proc.stderr.read()), daemon=True)
+    drain.start()
+    result = 0
+    try:
+        # use_float: keep numbers as float like json.loads (ijson defaults to Decimal)
+        result = consume(ijson.items(proc.stdout, 'items.item', use_float=True))
+    except ijson.IncompleteJSONError:
+        # No (complete) list on stdout: kubectl failed, its exit code tells why
+        if proc.wait() == 0:
+            raise
+    finally:
+        # Unblock kubectl if parsing stopped early, then reap it
+        proc.stdout.close()
+        proc.wait()
+        drain.join()
+    return result, proc.returncode, stderr[0] if stderr else b''
+
+
+def write_file(path: Path | str, data: bytes, dir_fd: int | None = None):
+    """
+    Write bytes to a file with raw os.open/os.write.
+    
+    Skips the buffered file object of Path.write_bytes (and its extra fstat/lseek
+    calls): fetches write thousands of small files. With dir_fd, path is a file
+    name relative to that open directory.
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644, dir_fd=dir_fd)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+# helper to load normalize.normalize
+# (regular package import: lib/normalize.py is executed once per process, and the
+# import lock makes the first load safe from concurrent fetch threads)
 def load_normalize_func():
-    spec = importlib.util.spec_from_file_location('normalize', str(LIB / 'normalize.py'))
-    mod = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(mod)  # type: ignore
-    return getattr(mod, 'normalize')
+    from lib.normalize import normalize
+    return normalize
+
+
+def kubectl_cmd(context: str, *args: str) -> list[str]:
+    """Build a kubectl command line for a context."""
+    return ['kubectl', '--context', context, *args]
+
+
+def kubectl_get_cmd(context: str, kind: str, ns: str | None) -> list[str]:
+    """Build the 'kubectl get -o json' command for a resource type (or comma-separated types)."""
+    if ns:
+        # Namespaced lists are small: --chunk-size=0 returns them in a single
+        # API request instead of kubectl's default pages of 500 items
+        return kubectl_cmd(context, '-n', ns, 'get', kind, '-o', 'json', '--chunk-size=0')
+    # Cluster-wide lists are paged explicitly, like the proxy requests: the API
+    # server never builds one huge response (same as kubectl's default page size)
+    return kubectl_cmd(context, 'get', kind, '--all-namespaces', '-o', 'json', f'--chunk-size={API_CHUNK_SIZE}')
+
+
+def available_kinds(context: str) -> frozenset[str] | None:
+    """
+    Resource types the cluster can list, from one 'kubectl api-resources' call.
+    
+    Returns:
+        Lowercased kinds, plural names and short names, or None if discovery failed
+        (in that case no type is filtered out)
+    """
+    try:
+        proc = subprocess.run(kubectl_cmd(context, 'api-resources', '--verbs=list', '--request-timeout=10s'),
+                              capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    lines = proc.stdout.splitlines()
+    # Columns: NAME SHORTNAMES APIVERSION NAMESPACED KIND (SHORTNAMES may be empty)
+    if proc.returncode != 0 or not lines or not lines[0].split()[-1:] == ['KIND']:
+        return None
+    kinds = set()
+    for line in lines[1:]:
+        fields = line.split()
+        if len(fields) < 4:
+            continue
+        kinds.add(fields[0].lower())
+        kinds.add(fields[-1].lower())
+        if len(fields) == 5:
+            kinds.update(short.lower() for short in fields[1].split(','))
+    return frozenset(kinds)
+
+
+# "Starting to serve on 127.0.0.1:<port>"
+PROXY_PORT_RE = re.compile(r':(\d+)\s*$')
+
+# Seconds to wait for kubectl proxy to print its address (credential plugins run first)
+PROXY_START_TIMEOUT = 30
+
+# Last stderr lines of kubectl proxy kept for error messages
+PROXY_STDERR_LINES = 20
+
+
+class KubectlProxy:
+    """
+    Local 'kubectl proxy' for one context, queried over keep-alive HTTP connections.
+    
+    Every 'kubectl get' process repeats kubeconfig parsing, the TLS handshake and
+    credential plugins (e.g. 'aws eks get-token'); the proxy pays them once and
+    all resource lists are then plain HTTP GETs on localhost.
+    """
+    
+    def __init__(self, context: str):
+        self.context = context
+        self.proc = subprocess.Popen(kubectl_cmd(context, 'proxy', '--port=0'),
+                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        # Both pipes are drained for the whole life of the proxy: warnings printed
+        # during a long fetch (auth, throttling) must never fill a pipe and block it
+        self._stderr_tail = deque(maxlen=PROXY_STDERR_LINES)
+        stderr_reader = Thread(target=self._stderr_tail.extend, args=(self.proc.stderr,), daemon=True)
+        stderr_reader.start()
+        first_line = []
+        started = Event()
+        
+        def read_stdout():
+            first_line.append(self.proc.stdout.readline())
+            started.set()
+            for _ in self.proc.stdout:
+                pass
+        Thread(target=read_stdout, daemon=True).start()
+        
+        # kubectl prints "Starting to serve on 127.0.0.1:<port>" once ready
+        timed_out = not started.wait(PROXY_START_TIMEOUT)
+        line = first_line[0] if first_line else ''
+        match = PROXY_PORT_RE.search(line)
+        if not match:
+            self.proc.kill()
+            self.proc.wait()
+            stderr_reader.join(timeout=1)
+            if timed_out:
+                raise RuntimeError(f'kubectl proxy did not start within {PROXY_START_TIMEOUT}s')
+            raise RuntimeError((''.join(self._stderr_tail) or line).strip() or 'kubectl proxy did not start')
+        self.port = int(match.group(1))
+        self._local = local()
+        self._discovery = None
+        self._discovery_lock = Lock()
+    
+    def get(self, path: str, stream: bool = False) -> tuple[int, bytes]:
+        """
+        GET an API path; returns (HTTP status, body). One connection per thread.
+        
+        With stream=True a successful body is returned as the open response (a
+        binary file object), to be read to the end before the next request.
+        """
+        for attempt in range(2):
+            conn = getattr(self._local, 'conn', None)
+            if conn is None:
+                conn = self._local.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=120)
+            try:
+                conn.request('GET', path, headers={'Accept': 'application/json'})
+                resp = conn.getresponse()
+                if stream and resp.status == 200:
+                    return resp.status, resp
+                return resp.status, resp.read()
+            except (http.client.HTTPException, ConnectionError):
+                # Stale keep-alive connection: reconnect once
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+    
+    def resource_info(self, kind: str) -> tuple[str, str, str, bool] | None:
+        """
+        REST endpoint of a resource type: (apiVersion, Kind, plural, namespaced).
+        
+        Built-in types come from RESOURCE_API; anything else (other built-ins, CRDs)
+        is resolved through API discovery, run once per proxy on first need.
+        """
+        if kind in RESOURCE_API:
+            return (*RESOURCE_API[kind], True)
+        with self._discovery_lock:
+            if self._discovery is None:
+                self._discovery = self._discover()
+        return self._discovery.get(kind.lower())
+    
+    def _discover(self) -> dict:
+        """Map kinds, plurals, singular and short names to endpoints (preferred group versions)."""
+        found = {}
+        
+        def add(group_version, resources):
+            for res in resources:
+                # Skip subresources (pods/log, ...) and types that cannot be listed
+                if '/' in res['name'] or 'list' not in res.get('verbs', []):
+                    continue
+                info = (group_version, res['kind'], res['name'], res.get('namespaced', True))
+                for key in (res['kind'], res['name'], res.get('singularName'), *res.get('shortNames', [])):
+                    if key:
+                        found.setdefault(key.lower(), info)
+        
+        # Core group first: like kubectl, it wins over groups with the same names
+        status, body = self.get('/api/v1')
+        if status == 200:
+            add('v1', load_json(body).get('resources', []))
+        status, body = self.get('/apis')
+        groups = load_json(body).get('groups', []) if status == 200 else []
+        for group in groups:
+            group_version = group['preferredVersion']['groupVersion']
+            status, body = self.get(f'/apis/{group_version}')
+            if status == 200:
+                add(group_version, load_json(body).get('resources', []))
+        return found
+    
+    def close(self):
+        """Stop the proxy process."""
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+
+def start_proxy(context: str) -> KubectlProxy | None:
+    """Start the --api-proxy proxy for a context; None (with a warning) if it cannot start."""
+    try:
+        return KubectlProxy(context)
+    except (OSError, RuntimeError) as e:
+        print(f"[{context}] {YELLOW}⚠{RESET}  kubectl proxy unavailable ({e}), using kubectl get", file=sys.stderr)
+        return None
+
+
+def resource_api_path(info: tuple[str, str, str, bool], ns: str | None) -> str:
+    """REST path listing a resource type (see KubectlProxy.resource_info), in a namespace or cluster-wide."""
+    api_version, _, plural, namespaced = info
+    base = '/api/v1' if api_version == 'v1' else f'/apis/{api_version}'
+    if ns and namespaced:
+        return f"{base}/namespaces/{ns}/{plural}"
+    return f"{base}/{plural}"
 
 
-def fetch_single_resource(context: str, kind: str, ns: str | None, outdir: Path, norm, show_metadata: bool, single_cluster_mode: bool, print_lock: Lock):
+# kubectl errors that terminate execution: (substrings of the lowercased stderr, message)
+CRITICAL_ERRORS = (
+    (('does not exist',), "Context '{context}' does not exist in kubeconfig"),
+    (('no such host', 'dial tcp'), "Unable to connect to cluster '{context}'"),
+    (('timeout', 'timed out'), "Connection timeout to cluster '{context}'"),
+)
+
+
+def critical_error_message(context: str, stderr: str) -> str | None:
+    """
+    Classify kubectl errors that must terminate execution.
+    
+    Returns:
+        Error message for connectivity/context errors, None for non-critical errors
+    """
+    stderr = stderr.casefold()
+    for needles, message in CRITICAL_ERRORS:
+        if any(needle in stderr for needle in needles):
+            return message.format(context=context)
+    return None
+
+
+def write_items(items, kind_of, outdir: Path, norm, show_metadata: bool, single_cluster_mode: bool, pretty: bool = False, index: dict | None = None) -> int:
+    """
+    Normalize kubectl list items and write one JSON file per resource.
+    
+    Args:
+        items: Iterable of kubectl list items (see iter_list_items)
+        kind_of: Function returning the resource type used as filename prefix for an item
+        outdir: Output directory for fetched resources
+        norm: Normalize function
+        show_metadata: Whether to keep metadata in normalized output
+        single_cluster_mode: If True, exclude namespace from filename
+        pretty: If True, write indented JSON instead of compact JSON
+        index: Optional dict filled with file name → content hash (see INDEX_NAME)
+        
+    Returns:
+        Number of resources written
+    """
+    resource_count = 0
+    # Resolve the output directory once and create files relative to it: each
+    # file then costs a single name lookup, which matters on overlay/network FS
+    dir_fd = None
+    if os.open in os.supports_dir_fd:
+        dir_fd = os.open(outdir, os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0))
+    # Pending writes of this list, oldest first (completed ones are dropped as we go)
+    writes = deque()
+    slots = WRITE_SLOTS
+    try:
+        for item in items:
+            kind = kind_of(item)
+            name = item.get('metadata', {}).get('name')
+            item_ns = item.get('metadata', {}).get('namespace')
+            # In single-cluster mode (namespace comparison), exclude namespace from filename
+            # so that the same resource in different namespaces can be matched and compared
+            if single_cluster_mode:
+                fname = f"{kind}__{name}.json"
+            elif item_ns:
+                fname = f"{kind}__{item_ns}__{name}.json"
+            else:
+                fname = f"{kind}__{name}.json"
+            resource_count += 1
+            # pass show-metadata flag to the normalizer
+            n = norm(item, keep_metadata=bool(show_metadata))
+            data = dump_json(n, pretty)
+            if index is not None:
+                index[fname] = hashlib.blake2b(data, digest_size=16).hexdigest()
+            # Surface write errors early
+            while writes and writes[0].done():
+                writes.popleft().result()
+            slots.acquire()
+            try:
+                if dir_fd is None:
+                    future = WRITE_EXECUTOR.submit(write_file, outdir / fname, data)
+                else:
+                    future = WRITE_EXECUTOR.submit(write_file, fname, data, dir_fd=dir_fd)
+            except BaseException:
+                slots.release()
+                raise
+            future.add_done_callback(lambda _: slots.release())
+            writes.append(future)
+        while writes:
+            writes.popleft().result()
+    finally:
+        # Queued writes use dir_fd: they must finish before it is closed
+        wait(writes)
+        if dir_fd is not None:
+            os.close(dir_fd)
+    return resource_count
+
+
+def fetch_single_resource(context: str, kind: str, ns: str | None, outdir: Path, norm, show_metadata: bool, single_cluster_mode: bool, print_lock: Lock, pretty: bool = False, index: dict | None = None):
     """
     Fetch a single resource type from a Kubernetes cluster.
     This function is designed to be called in parallel for different resource types.
@@ -238,13 +855,13 @@ def fetch_single_resource(context: str, kind: str, ns: str | None, outdir: Path,
         show_metadata: Whether to keep metadata in normalized output
         single_cluster_mode: If True, exclude namespace from filename
         print_lock: Thread lock for synchronized console output
+        pretty: If True, write indented JSON instead of compact JSON
+        index: Optional dict filled with file name → content hash
         
     Returns:
         tuple: (success: bool, resource_count: int, has_errors: bool, error_message: str | None)
     """
-    resource_count = 0
     has_errors = False
-    error_message = None
     
     try:
         with print_lock:
@@ -253,29 +870,32 @@ def fetch_single_resource(context: str, kind: str, ns: str | None, outdir: Path,
             else:
                 print(f"[{context}] Fetching {kind}...")
         
-        cmd = ['kubectl', '--context', context]
-        if ns:
-            cmd += ['-n', ns, 'get', kind, '-o', 'json']
+        if ns is None and ijson is not None:
+            # Cluster-wide lists can be tens of MB: parse them straight from the pipe
+            resource_count, returncode, stderr = run_kubectl_streamed(
+                kubectl_get_cmd(context, kind, ns),
+                lambda items: write_items(items, lambda item: kind, outdir, norm, show_metadata, single_cluster_mode, pretty, index))
         else:
-            cmd += ['get', kind, '--all-namespaces', '-o', 'json']
-
-        proc = subprocess.run(cmd, check=False, capture_output=True, text=True)
-        if proc.returncode != 0:
-            stderr = proc.stderr.strip()
+            # Capture raw bytes: the JSON parser reads UTF-8 directly, so we never hold
+            # a decoded str copy of a (possibly multi-MB) list response
+            proc = subprocess.run(kubectl_get_cmd(context, kind, ns), check=False, capture_output=True)
+            returncode, stderr = proc.returncode, proc.stderr
+            if returncode == 0:
+                items = iter_list_items(proc.stdout)
+                # The iterator owns the raw response from here on
+                del proc
+                resource_count = write_items(items, lambda item: kind, outdir, norm, show_metadata, single_cluster_mode, pretty, index)
+        
+        if returncode != 0:
+            stderr = output_text(stderr).strip()
             
             # CRITICAL connectivity errors (terminate execution)
-            if 'does not exist' in stderr:
-                error_message = f"Context '{context}' does not exist in kubeconfig"
-                return False, 0, True, error_message
-            elif 'no such host' in stderr or 'dial tcp' in stderr:
-                error_message = f"Unable to connect to cluster '{context}'"
-                return False, 0, True, error_message
-            elif 'timeout' in stderr.lower() or 'timed out' in stderr.lower():
-                error_message = f"Connection timeout to cluster '{context}'"
+            error_message = critical_error_message(context, stderr)
+            if error_message:
                 return False, 0, True, error_message
             
             # NON-critical errors (permissions, empty resources, etc)
-            elif 'Forbidden' in stderr or 'forbidden' in stderr:
+            if 'forbidden' in stderr.casefold():
                 ns_info = f" in namespace '{ns}'" if ns else " at cluster level"
                 with print_lock:
                     print(f"[{context}] {RED}[ERROR]{RESET} Insufficient permissions for {kind}{ns_info}.", file=sys.stderr)
@@ -290,36 +910,97 @@ def fetch_single_resource(context: str, kind: str, ns: str | None, outdir: Path,
                 return True, 0, has_errors, None
             else:
                 with print_lock:
-                    print(f"[{context}] {YELLOW}⚠{RESET}  kubectl returned non-zero for {kind} (exit code {proc.returncode})", file=sys.stderr)
+                    print(f"[{context}] {YELLOW}⚠{RESET}  kubectl returned non-zero for {kind} (exit code {returncode})", file=sys.stderr)
                 has_errors = True
                 return True, 0, has_errors, None
         
-        data = json.loads(proc.stdout) if proc.stdout.strip() else {}
-        items = data.get('items', [])
-        if not items:
+        if resource_count == 0:
             ns_info = f" in {ns}" if ns else ""
             with print_lock:
                 print(f"[{context}] Nessun oggetto {kind}{ns_info}.")
-            return True, 0, has_errors, None
+        return True, resource_count, has_errors, None
         
-        for item in items:
-            name = item.get('metadata', {}).get('name')
-            item_ns = item.get('metadata', {}).get('namespace')
-            # In single-cluster mode (namespace comparison), exclude namespace from filename
-            # so that the same resource in different namespaces can be matched and compared
-            if single_cluster_mode:
-                fname = f"{kind}__{name}.json"
-            elif item_ns:
-                fname = f"{kind}__{item_ns}__{name}.json"
+    except Exception as e:
+        with print_lock:
+            print(f"[{context}] Errore fetching {kind}: {e}", file=sys.stderr)
+        return True, 0, True, None
+
+
+def fetch_single_resource_api(proxy: KubectlProxy, context: str, kind: str, ns: str | None, outdir: Path, norm, show_metadata: bool, single_cluster_mode: bool, print_lock: Lock, pretty: bool = False, index: dict | None = None):
+    """
+    Fetch a single resource type through a KubectlProxy instead of a kubectl process.
+    
+    Args:
+        proxy: Running proxy for the context
+        kind: Resource type to fetch (must be resolvable by proxy.resource_info)
+        (other arguments as in fetch_single_resource)
+        
+    Returns:
+        Same tuple as fetch_single_resource
+    """
+    try:
+        with print_lock:
+            if ns:
+                print(f"[{context}/{ns}] Fetching {kind}...")
             else:
-                fname = f"{kind}__{name}.json"
-            path = outdir / fname
-            resource_count += 1
-            # pass show-metadata flag to the normalizer
-            n = norm(item, keep_metadata=bool(show_metadata))
-            path.write_text(json.dumps(n, sort_keys=True, indent=2, ensure_ascii=False) + "\n", encoding='utf-8')
+                print(f"[{context}] Fetching {kind}...")
         
-        return True, resource_count, has_errors, None
+        # Items of a REST list carry no kind/apiVersion (kubectl adds them): set them
+        # so the written files match the kubectl output
+        info = proxy.resource_info(kind)
+        api_version, kind_name, _, _ = info
+        def with_type(items):
+            for item in items:
+                item.setdefault('apiVersion', api_version)
+                item.setdefault('kind', kind_name)
+                yield item
+        
+        def page_items(page):
+            # Pop items as they are yielded so each object is freed once written
+            items = page.get('items') or []
+            while items:
+                yield items.pop()
+        
+        # Read the list in pages of API_CHUNK_SIZE items, following the continue
+        # token: memory stays bounded by one page even for cluster-wide lists.
+        # With ijson, each page is parsed straight from the socket as it arrives.
+        path = resource_api_path(info, ns)
+        query = {'limit': API_CHUNK_SIZE}
+        resource_count = 0
+        while True:
+            status, body = proxy.get(f"{path}?{urllib.parse.urlencode(query)}", stream=ijson is not None)
+            if status != 200:
+                message = output_text(body).strip()
+                error_message = critical_error_message(context, message)
+                if error_message:
+                    return False, 0, True, error_message
+                with print_lock:
+                    if status == 403:
+                        ns_info = f" in namespace '{ns}'" if ns else " at cluster level"
+                        print(f"[{context}] {RED}[ERROR]{RESET} Insufficient permissions for {kind}{ns_info}.", file=sys.stderr)
+                    else:
+                        print(f"[{context}] {YELLOW}⚠{RESET}  API error per {kind} (HTTP {status}): {message[:100]}", file=sys.stderr)
+                return True, resource_count, True, None
+            
+            if isinstance(body, (bytes, str)):
+                page = load_json(body)
+                del body
+                items = page_items(page)
+                meta = page.get('metadata') or {}
+            else:
+                meta = {}
+                items = iter_list_stream(body, meta)
+            resource_count += write_items(with_type(items), lambda item: kind, outdir, norm, show_metadata, single_cluster_mode, pretty, index)
+            token = meta.get('continue')
+            if not token:
+                break
+            query['continue'] = token
+        
+        if resource_count == 0:
+            ns_info = f" in {ns}" if ns else ""
+            with print_lock:
+                print(f"[{context}] Nessun oggetto {kind}{ns_info}.")
+        return True, resource_count, False, None
         
     except Exception as e:
         with print_lock:
@@ -327,7 +1008,50 @@ def fetch_single_resource(context: str, kind: str, ns: str | None, outdir: Path,
         return True, 0, True, None
 
 
-def fetch_resources(context: str, outdir: Path, resources: list[str], namespaces: list[str] | str | None, show_metadata: bool = False, single_cluster_mode: bool = False, max_workers: int = 10):
+def fetch_resource_batch(context: str, kinds: list[str], ns: str | None, outdir: Path, norm, show_metadata: bool, single_cluster_mode: bool, print_lock: Lock, pretty: bool = False, index: dict | None = None):
+    """
+    Fetch several resource types with a single 'kubectl get kind1,kind2,...' call.
+    
+    kubectl returns one List with mixed items, so the filename prefix is taken from
+    each item's own 'kind'. Only types listed in ALL_SUPPORTED_RESOURCES may be
+    batched: their names match the lowercased Kind, so files are named exactly as
+    with per-type fetches.
+    
+    Args:
+        kinds: Resource types to fetch together
+        (other arguments as in fetch_single_resource)
+        
+    Returns:
+        Same tuple as fetch_single_resource, or None when the combined call failed
+        with a non-critical error (e.g. one forbidden type) and the types must be
+        fetched one by one
+    """
+    kinds_csv = ','.join(kinds)
+    try:
+        with print_lock:
+            if ns:
+                print(f"[{context}/{ns}] Fetching {kinds_csv}...")
+            else:
+                print(f"[{context}] Fetching {kinds_csv}...")
+        
+        proc = subprocess.run(kubectl_get_cmd(context, kinds_csv, ns), check=False, capture_output=True)
+        if proc.returncode != 0:
+            error_message = critical_error_message(context, output_text(proc.stderr).strip())
+            if error_message:
+                return False, 0, True, error_message
+            return None
+        
+        items = iter_list_items(proc.stdout)
+        del proc
+        resource_count = write_items(items, lambda item: str(item.get('kind', 'unknown')).lower(), outdir, norm, show_metadata, single_cluster_mode, pretty, index)
+        return True, resource_count, False, None
+        
+    except Exception:
+        # Unexpected output: retry with the per-type path, which reports errors per type
+        return None
+
+
+def fetch_resources(context: str, outdir: Path, resources: list[str], namespaces: list[str] | str | None, show_metadata: bool = False, single_cluster_mode: bool = False, max_workers: int = 10, batch: bool = False, pretty: bool = False, api_proxy: bool = False, served_kinds: frozenset[str] | None = None, proxy: KubectlProxy | None = None):
     """
     Fetch resources from a Kubernetes cluster using parallel threads.
     
@@ -339,6 +1063,13 @@ def fetch_resources(context: str, outdir: Path, resources: list[str], namespaces
         show_metadata: Whether to keep metadata in normalized output
         single_cluster_mode: If True, exclude namespace from filename (for namespace comparison within same cluster)
         max_workers: Maximum number of parallel threads (default: 10)
+        batch: If True, fetch all supported resource types with one kubectl call per namespace
+        pretty: If True, write indented JSON files instead of compact JSON
+        api_proxy: If True, fetch supported resource types through one 'kubectl proxy' for the context
+        served_kinds: Resource types served by the cluster (see available_kinds); others are skipped
+        proxy: Running proxy shared by several calls for the same context (e.g. one per
+            namespace in single-cluster mode); the caller closes it. Without it,
+            api_proxy starts a proxy for this call only
     """
     outdir.mkdir(parents=True, exist_ok=True)
     norm = load_normalize_func()
@@ -350,39 +1081,86 @@ def fetch_resources(context: str, outdir: Path, resources: list[str], namespaces
     elif isinstance(namespaces, str):
         ns_list = [namespaces]  # Single namespace
     else:
-        ns_list = namespaces  # Multiple specific namespaces
+        # Multiple specific namespaces: a repeated name would be fetched twice into the same files
+        ns_list = list(dict.fromkeys(namespaces))
+    # Same for repeated types (e.g. -r listing one that --include-volatile adds again)
+    resources = list(dict.fromkeys(resources))
+
+    # Skip types the cluster does not serve (e.g. a removed API version): otherwise
+    # each of them costs one failing kubectl call per namespace
+    if served_kinds is not None:
+        unavailable = [kind for kind in resources if kind.lower().split('.')[0] not in served_kinds]
+        if unavailable:
+            print(f"[{context}] {YELLOW}⚠{RESET}  Resource types not available in cluster, skipped: {', '.join(unavailable)}", file=sys.stderr)
+            resources = [kind for kind in resources if kind not in unavailable]
 
     total_resource_count = 0
     has_any_errors = False
     critical_error = None
+    # Content hashes of the written files: compare.py skips identical resources without parsing them
+    index = {}
     
-    # Create tasks for parallel execution
-    tasks = []
-    for kind in resources:
-        for ns in ns_list:
-            tasks.append((context, kind, ns, outdir, norm, show_metadata, single_cluster_mode, print_lock))
-    
-    # Execute tasks in parallel
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {
-            executor.submit(fetch_single_resource, *task): task 
-            for task in tasks
-        }
-        
-        for future in as_completed(futures):
-            success, resource_count, has_errors, error_message = future.result()
-            
-            if not success and error_message:
-                # Critical error occurred
-                critical_error = error_message
-                # Cancel remaining tasks
-                for f in futures:
-                    f.cancel()
-                break
+    own_proxy = None
+    if proxy is None and api_proxy:
+        proxy = own_proxy = start_proxy(context)
+    
+    # Group resource types: batched types share one kubectl call per namespace,
+    # everything else is fetched type by type (the proxy makes batching pointless)
+    groups = [[kind] for kind in resources]
+    if batch and proxy is None:
+        batchable = [kind for kind in resources if kind in SUPPORTED_RESOURCE_SET]
+        if len(batchable) > 1:
+            # kubectl lists the types of a combined call one after the other: split them
+            # into parallel calls of at most BATCH_MAX_KINDS types, and into at least as
+            # many calls as there are large types. Dealing the large types out first
+            # then gives each call at most one of them
+            large = sum(kind in LARGE_PAYLOAD_RESOURCES for kind in batchable)
+            shards = max(-(-len(batchable) // BATCH_MAX_KINDS), large)
+            ordered = sorted(batchable, key=lambda kind: kind not in LARGE_PAYLOAD_RESOURCES)
+            groups = [sorted(ordered[i::shards], key=batchable.index) for i in range(shards)]
+            groups += [[kind] for kind in resources if kind not in batchable]
+    # Longest-processing-time first: heaviest groups are submitted (and started) first
+    groups.sort(key=lambda kinds: -sum(KIND_WEIGHT.get(kind.lower(), 1) for kind in kinds))
+    
+    def submit(executor, kinds, ns):
+        if len(kinds) > 1:
+            return executor.submit(fetch_resource_batch, context, kinds, ns, outdir, norm, show_metadata, single_cluster_mode, print_lock, pretty, index)
+        if proxy is not None and proxy.resource_info(kinds[0]) is not None:
+            return executor.submit(fetch_single_resource_api, proxy, context, kinds[0], ns, outdir, norm, show_metadata, single_cluster_mode, print_lock, pretty, index)
+        return executor.submit(fetch_single_resource, context, kinds[0], ns, outdir, norm, show_metadata, single_cluster_mode, print_lock, pretty, index)
+    
+    # Execute tasks in parallel (no point in spawning more threads than tasks)
+    workers = max(1, min(max_workers, len(resources) * len(ns_list)))
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = {submit(executor, kinds, ns): (kinds, ns) for kinds in groups for ns in ns_list}
             
-            total_resource_count += resource_count
-            if has_errors:
-                has_any_errors = True
+            while pending and not critical_error:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kinds, ns = pending.pop(future)
+                    result = future.result()
+                    
+                    if result is None:
+                        # Combined call failed: fall back to one call per type
+                        for kind in kinds:
+                            pending[submit(executor, [kind], ns)] = ([kind], ns)
+                        continue
+                    
+                    success, resource_count, has_errors, error_message = result
+                    if not success and error_message:
+                        # Critical error occurred: drop queued kubectl calls, the
+                        # cluster is unreachable and they would all fail the same way
+                        critical_error = error_message
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        break
+                    
+                    total_resource_count += resource_count
+                    if has_errors:
+                        has_any_errors = True
+    finally:
+        if own_proxy is not None:
+            own_proxy.close()
     
     # Handle critical errors
     if critical_error:
@@ -400,6 +1178,8 @@ def fetch_resources(context: str, outdir: Path, resources: list[str], namespaces
             print(f"{YELLOW}Suggestion:{RESET} Check network connectivity and that cluster is active", file=sys.stderr)
         sys.exit(2)
     
+    (outdir / INDEX_NAME).write_text(''.join(f"{name}\t{digest}\n" for name, digest in sorted(index.items())), encoding='utf-8')
+    
     # Final check: if no resources retrieved, it could be a serious problem
     if total_resource_count == 0 and has_any_errors:
         print(f"\n{RED}[WARNING]:{RESET} No resources retrieved from '{context}' due to errors.", file=sys.stderr)
@@ -409,6 +1189,55 @@ def fetch_resources(context: str, outdir: Path, resources: list[str], namespaces
     return True
 
 
+def fetch_cluster(context: str, outdir: Path, resources: list[str], namespaces: list[str] | str | None, show_metadata: bool = False, single_cluster_mode: bool = False, max_workers: int = 10, batch: bool = False, pretty: bool = False, api_proxy: bool = False):
+    """
+    Discover the resource types served by a cluster, then fetch them.
+    
+    Same arguments as fetch_resources (served_kinds comes from available_kinds).
+    """
+    return fetch_resources(context, outdir, resources, namespaces, show_metadata, single_cluster_mode, max_workers, batch, pretty, api_proxy, available_kinds(context))
+
+
+def compare_namespace_pair(comparison_dir: Path, dir1: Path, dir2: Path, label1: str, label2: str, canonical: bool = False) -> str:
+    """
+    Run compare and diff_details for one namespace pair (single-cluster mode).
+    
+    Designed to run in a worker process for different pairs in parallel: the
+    output of both steps is captured and returned so the caller can print it
+    without interleaving.
+    
+    Args:
+        comparison_dir: Output directory of this pair (diffs/, summary.json, reports)
+        dir1: Directory with the fetched resources of the first namespace
+        dir2: Directory with the fetched resources of the second namespace
+        label1: Display label of the first namespace (cluster/namespace)
+        label2: Display label of the second namespace (cluster/namespace)
+        canonical: Files were written indented (--pretty-fetched), compare uses them as they are
+        
+    Returns:
+        Combined stdout/stderr of both steps
+    """
+    diffs = comparison_dir / 'diffs'
+    json_out = comparison_dir / 'summary.json'
+    output = io.StringIO()
+    with redirect_stdout(output), redirect_stderr(output):
+        try:
+            # Files are compared in this process: the pairs already run in parallel processes
+            compare.main([str(dir1), str(dir2), str(diffs), '--json-out', str(json_out)] + (['--canonical'] if canonical else []),
+                         keep_resources=True)
+            
+            # Generate HTML report for this comparison
+            # Namespace directories live outside comparison_dir, so pass absolute
+            # paths plus the full cluster/namespace labels for display
+            diff_details.main([str(comparison_dir),
+                               '--cluster1', str(dir1.resolve()), '--cluster2', str(dir2.resolve()),
+                               '--cluster1-label', label1, '--cluster2-label', label2])
+        except Exception:
+            # Report the failure of this pair without aborting the others
+            traceback.print_exc()
+    return output.getvalue()
+
+
 class VersionAction(argparse.Action):
     """Custom action to show banner with version."""
     def __call__(self, parser, namespace, values, option_string=None):
@@ -533,11 +1362,23 @@ Default resources compared:
                        action='store_true',
                        help='Keep metadata.labels and annotations in normalized output. By default, metadata is stripped to focus on actual configuration differences')
     
+    parser.add_argument('--api-proxy',
+                       action='store_true',
+                       help='Fetch resources through a single "kubectl proxy" per cluster instead of one kubectl process per resource type. Authenticates once per cluster (faster with exec credential plugins such as EKS)')
+    
+    parser.add_argument('--pretty-fetched',
+                       action='store_true',
+                       help='Write fetched resource files as indented JSON for manual inspection. By default they are written as compact JSON (reports always show them formatted)')
+    
     parser.add_argument('--max-workers',
                        type=int,
-                       default=10,
+                       default=default_max_workers(),
                        metavar='N',
-                       help='Maximum number of parallel threads for fetching resources (default: 10). Increase for faster performance with many resources, decrease if experiencing API rate limits')
+                       help='Maximum number of parallel threads for fetching resources (default: 10, or KDIFF_FETCH_WORKERS). Increase for faster performance with many resources, decrease if experiencing API rate limits')
+    
+    parser.add_argument('--batch-resources',
+                       action='store_true',
+                       help='Fetch all supported resource types with a single kubectl call per namespace instead of one call per type. Falls back to per-type calls if the combined call fails (e.g. missing permissions on one type)')
     
     args = parser.parse_args()
 
@@ -560,7 +1401,8 @@ Default resources compared:
         if not args.namespaces:
             print("Error: Single-cluster mode (-c) requires -n with at least 2 namespaces", file=sys.stderr)
             sys.exit(2)
-        namespaces_list = [ns.strip() for ns in args.namespaces.split(',') if ns.strip()]
+        # Repeated namespaces would only add duplicate pairs (and a namespace compared with itself)
+        namespaces_list = list(dict.fromkeys(ns.strip() for ns in args.namespaces.split(',') if ns.strip()))
         if len(namespaces_list) < 2:
             print("Error: Single-cluster mode requires at least 2 namespaces", file=sys.stderr)
             sys.exit(2)
@@ -611,12 +1453,17 @@ Default resources compared:
         # Test both clusters in two-cluster mode
         # Pass namespace list if specified for namespace-scoped permission testing
         test_namespaces = namespaces_list if namespaces_list else None
-        success1, error_msg1 = test_cluster_connectivity(args.c1, test_namespaces)
+        # Both checks run concurrently: each one can wait up to 15 seconds
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            future1 = executor.submit(test_cluster_connectivity, args.c1, test_namespaces)
+            future2 = executor.submit(test_cluster_connectivity, args.c2, test_namespaces)
+            success1, error_msg1 = future1.result()
+            success2, error_msg2 = future2.result()
+        
         if not success1:
             print(f"\n{RED}[ERROR] CONNECTIVITY ERROR (Cluster 1):{RESET} {error_msg1}", file=sys.stderr)
             connectivity_failed = True
             
-        success2, error_msg2 = test_cluster_connectivity(args.c2, test_namespaces)
         if not success2:
             print(f"\n{RED}[ERROR] CONNECTIVITY ERROR (Cluster 2):{RESET} {error_msg2}", file=sys.stderr)
             connectivity_failed = True
@@ -642,7 +1489,7 @@ Default resources compared:
         else:
             resources = [r.strip() for r in args.include_resource_types.split(',') if r.strip()]
             # Validate that all specified resources are supported
-            unsupported = [r for r in resources if r.lower() not in [x.lower() for x in ALL_SUPPORTED_RESOURCES]]
+            unsupported = [r for r in resources if r.lower() not in SUPPORTED_RESOURCE_SET]
             if unsupported:
                 print(f"Error: Unsupported resource types: {', '.join(unsupported)}", file=sys.stderr)
                 print(f"Supported types: {', '.join(ALL_SUPPORTED_RESOURCES)}", file=sys.stderr)
@@ -656,8 +1503,8 @@ Default resources compared:
     
     # Exclude specific resources if requested
     if args.exclude_resources:
-        exclude_list = [r.strip().lower() for r in args.exclude_resources.split(',') if r.strip()]
-        resources = [r for r in resources if r.lower() not in exclude_list]
+        exclude_set = {r.strip().lower() for r in args.exclude_resources.split(',') if r.strip()}
+        resources = [r for r in resources if r.lower() not in exclude_set]
         if not resources:
             print("Error: All resources excluded. Nothing to compare.", file=sys.stderr)
             sys.exit(2)
@@ -682,53 +1529,73 @@ Default resources compared:
             for j in range(i + 1, len(namespaces_list)):
                 comparison_pairs.append((namespaces_list[i], namespaces_list[j]))
         
+        # Fetch every namespace exactly once: each namespace takes part in
+        # several pairs, and re-querying the API server per pair is wasted work
+        ns_dirs = {ns: outdir / f"{args.c}_{ns}" for ns in namespaces_list}
+        served_kinds = available_kinds(args.c)
+        # One proxy for the whole cluster, shared by all namespace fetches
+        proxy = start_proxy(args.c) if args.api_proxy else None
+        print(f"\nFetching resources from {len(namespaces_list)} namespaces in parallel...")
+        
+        # Pipeline fetch and comparison: a pair is compared (CPU-bound, in a worker
+        # process) as soon as both its namespaces are fetched, while the remaining
+        # namespaces are still downloading. Output is captured and printed in pair
+        # order so the console log reads the same as a sequential run.
         all_successes = []
-        for ns1, ns2 in comparison_pairs:
-            print(f"\n{'='*60}")
-            print(f"Comparing: {ns1} vs {ns2}")
-            print(f"{'='*60}")
-            
-            # Create separate directory for this comparison
-            comparison_dir = outdir / f"{ns1}_vs_{ns2}"
-            comparison_dir.mkdir(parents=True, exist_ok=True)
-            
-            dir1 = comparison_dir / f"{args.c}_{ns1}"
-            dir2 = comparison_dir / f"{args.c}_{ns2}"
-            diffs = comparison_dir / 'diffs'
-            json_out = comparison_dir / 'summary.json'
+        ns_success = {}
+        pair_futures = {}
+        pair_workers = max(1, min(os.cpu_count() or 1, len(comparison_pairs)))
+        # All namespaces hit the same API server: --max-workers is split between the
+        # namespaces fetched at the same time, so at most that many kubectl calls run
+        ns_workers = max(1, min(len(namespaces_list), args.max_workers))
+        workers_per_ns = max(1, args.max_workers // ns_workers)
+        # 'spawn' workers: forking while fetch threads are running is not safe
+        with ThreadPoolExecutor(max_workers=ns_workers) as fetch_executor, \
+                ProcessPoolExecutor(max_workers=pair_workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            ns_futures = {
+                fetch_executor.submit(fetch_resources, args.c, ns_dirs[ns], resources, ns, args.show_metadata, True, workers_per_ns, args.batch_resources, args.pretty_fetched, False, served_kinds, proxy): ns
+                for ns in namespaces_list
+            }
+            try:
+                for future in as_completed(ns_futures):
+                    ns_success[ns_futures[future]] = future.result()
+                    for ns1, ns2 in comparison_pairs:
+                        if (ns1, ns2) in pair_futures or ns1 not in ns_success or ns2 not in ns_success:
+                            continue
+                        if not ns_success[ns1] and not ns_success[ns2]:
+                            continue
+                        # Create separate directory for this comparison
+                        comparison_dir = outdir / f"{ns1}_vs_{ns2}"
+                        comparison_dir.mkdir(parents=True, exist_ok=True)
+                        pair_futures[(ns1, ns2)] = executor.submit(
+                            compare_namespace_pair, comparison_dir, ns_dirs[ns1], ns_dirs[ns2],
+                            f"{args.c}/{ns1}", f"{args.c}/{ns2}", args.pretty_fetched)
+            finally:
+                # Every namespace is fetched: the shared proxy is no longer needed
+                if proxy is not None:
+                    proxy.close()
             
-            # Parallelize fetching from both namespaces
-            print(f"Fetching resources from both namespaces in parallel...")
-            success1, success2 = False, False
-            
-            with ThreadPoolExecutor(max_workers=2) as executor:
-                future1 = executor.submit(fetch_resources, args.c, dir1, resources, ns1, args.show_metadata, True, args.max_workers)
-                future2 = executor.submit(fetch_resources, args.c, dir2, resources, ns2, args.show_metadata, True, args.max_workers)
+            for ns1, ns2 in comparison_pairs:
+                print(f"\n{'='*60}")
+                print(f"Comparing: {ns1} vs {ns2}")
+                print(f"{'='*60}")
                 
-                # Wait for both to complete
-                success1 = future1.result()
-                success2 = future2.result()
-            
-            all_successes.append((success1, success2))
-            
-            if not success1 and not success2:
-                print(f"\n{RED}[ERROR]:{RESET} Unable to retrieve resources from both namespaces.", file=sys.stderr)
-                continue
-            elif not success1:
-                print(f"\n{RED}[ERROR]:{RESET} Unable to retrieve resources from '{ns1}'.", file=sys.stderr)
-                print(f"{YELLOW}Continuing with available resources from '{ns2}'...{RESET}", file=sys.stderr)
-            elif not success2:
-                print(f"\n{RED}[ERROR]:{RESET} Unable to retrieve resources from '{ns2}'.", file=sys.stderr)
-                print(f"{YELLOW}Continuing with available resources from '{ns1}'...{RESET}", file=sys.stderr)
-            
-            print("Comparing...")
-            rc = subprocess.run(['python3', str(LIB / 'compare.py'), str(dir1), str(dir2), str(diffs), '--json-out', str(json_out)]).returncode
-            
-            # Generate HTML report for this comparison
-            # Pass the actual directory names and full cluster/namespace for display
-            subprocess.run(['python3', str(LIB / 'diff_details.py'), str(comparison_dir), 
-                          '--cluster1', dir1.name, '--cluster2', dir2.name,
-                          '--cluster1-label', f"{args.c}/{ns1}", '--cluster2-label', f"{args.c}/{ns2}"])
+                success1 = ns_success[ns1]
+                success2 = ns_success[ns2]
+                all_successes.append((success1, success2))
+                
+                if not success1 and not success2:
+                    print(f"\n{RED}[ERROR]:{RESET} Unable to retrieve resources from both namespaces.", file=sys.stderr)
+                    continue
+                elif not success1:
+                    print(f"\n{RED}[ERROR]:{RESET} Unable to retrieve resources from '{ns1}'.", file=sys.stderr)
+                    print(f"{YELLOW}Continuing with available resources from '{ns2}'...{RESET}", file=sys.stderr)
+                elif not success2:
+                    print(f"\n{RED}[ERROR]:{RESET} Unable to retrieve resources from '{ns2}'.", file=sys.stderr)
+                    print(f"{YELLOW}Continuing with available resources from '{ns1}'...{RESET}", file=sys.stderr)
+                
+                print("Comparing...", flush=True)
+                print(pair_futures[(ns1, ns2)].result(), end='', flush=True)
         
         # Generate summary report for all comparisons
         print(f"\n{'='*60}")
@@ -757,9 +1624,11 @@ Default resources compared:
         # Parallelize fetching from both clusters
         print(f"\nFetching resources from both clusters in parallel...")
         
+        # One independent pipeline per cluster (type discovery, then fetch): a slow
+        # cluster never holds back the other one
         with ThreadPoolExecutor(max_workers=2) as executor:
-            future1 = executor.submit(fetch_resources, args.c1, dir1, resources, ns_to_fetch, args.show_metadata, False, args.max_workers)
-            future2 = executor.submit(fetch_resources, args.c2, dir2, resources, ns_to_fetch, args.show_metadata, False, args.max_workers)
+            future1 = executor.submit(fetch_cluster, args.c1, dir1, resources, ns_to_fetch, args.show_metadata, False, args.max_workers, args.batch_resources, args.pretty_fetched, args.api_proxy)
+            future2 = executor.submit(fetch_cluster, args.c2, dir2, resources, ns_to_fetch, args.show_metadata, False, args.max_workers, args.batch_resources, args.pretty_fetched, args.api_proxy)
             
             # Wait for both to complete
             success1 = future1.result()
@@ -777,11 +1646,16 @@ Default resources compared:
             print(f"{YELLOW}Continuing anyway with available resources from '{args.c1}'...{RESET}", file=sys.stderr)
 
         print("Comparing...")
-        # call compare.py
-        rc = subprocess.run(['python3', str(LIB / 'compare.py'), str(dir1), str(dir2), str(diffs), '--json-out', str(json_out)]).returncode
+        # Confronto e report in-process (nessun interprete Python aggiuntivo)
+        compare_args = [str(dir1), str(dir2), str(diffs), '--json-out', str(json_out), '--jobs', str(os.cpu_count() or 1)]
+        if args.pretty_fetched:
+            # Files already have the layout compare diffs: no re-formatting
+            compare_args.append('--canonical')
+        # Parsed resources stay cached for diff_details, which clears them
+        rc = compare.main(compare_args, keep_resources=True)
 
         # Report HTML interattivo dettagliato - SEMPRE generato (anche con 0 differenze)
-        subprocess.run(['python3', str(LIB / 'diff_details.py'), str(outdir), '--cluster1', args.c1, '--cluster2', args.c2])
+        diff_details.main([str(outdir), '--cluster1', args.c1, '--cluster2', args.c2, '--jobs', str(os.cpu_count() or 1)])
         
         # Path to the HTML report
         html_report = outdir / 'diff-details.html'
@@ -791,25 +1665,7 @@ Default resources compared:
             print(f"HTML Report: {html_report}")
             
             # Try to open HTML report in browser
-            if open_html_in_browser(html_report):
-                print(f"{GREEN}Opening report in browser...{RESET}")
-            else:
-                # Show OS-specific command to open the file
-                import platform
-                system = platform.system()
-                
-                # Use the path as-is (it's already relative to output dir)
-                file_path = html_report
-                
-                if system == 'Darwin':  # macOS
-                    cmd = f"open {file_path}"
-                elif system == 'Linux':
-                    cmd = f"xdg-open {file_path}"
-                elif system == 'Windows':
-                    cmd = f"start {file_path}"
-                else:
-                    cmd = f"<browser> {file_path}"
-                print(f"{YELLOW}Open manually: {cmd}{RESET}")
+            show_html_report(html_report)
             
             sys.exit(0)
         else:
@@ -818,30 +1674,13 @@ Default resources compared:
             
             # Report console (solo se richiesto formato text)
             if args.format == 'text':
-                subprocess.run(['python3', str(LIB / 'report.py'), str(json_out), str(diffs), '--cluster1', args.c1, '--cluster2', args.c2])
+                with buffered_stdout():
+                    report.main([str(json_out), str(diffs), '--cluster1', args.c1, '--cluster2', args.c2])
             
             print(f"HTML Report: {html_report}")
             
             # Try to open HTML report in browser
-            if open_html_in_browser(html_report):
-                print(f"{GREEN}Opening report in browser...{RESET}")
-            else:
-                # Show OS-specific command to open the file
-                import platform
-                system = platform.system()
-                
-                # Use the path as-is (it's already relative to output dir)
-                file_path = html_report
-                
-                if system == 'Darwin':  # macOS
-                    cmd = f"open {file_path}"
-                elif system == 'Linux':
-                    cmd = f"xdg-open {file_path}"
-                elif system == 'Windows':
-                    cmd = f"start {file_path}"
-                else:
-                    cmd = f"<browser> {file_path}"
-                print(f"{YELLOW}Open manually: {cmd}{RESET}")
+            show_html_report(html_report)
             
             sys.exit(1)
 
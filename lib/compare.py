@@ -20,21 +20,103 @@ Exit code:
 - 0: no differences
 - 1: differences detected
 
-Usage: python3 compare.py DIR1 DIR2 DIFFS_DIR [--json-out summary.json]
+Usage: python3 compare.py DIR1 DIR2 DIFFS_DIR [--json-out summary.json] [--jobs N] [--canonical]
 """
 import argparse
 from pathlib import Path
 import json
+import os
 import sys
 import difflib
+import filecmp
+import multiprocessing
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
+# Parser/serializer JSON opzionale (estensione C, molto più veloce della stdlib)
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on environment
+    orjson = None
 
-def read_json_text(p: Path):
+# Indice scritto da kdiff accanto alle risorse: una riga "nome_file<TAB>hash" per file
+INDEX_NAME = 'index.tsv'
+
+# Numero minimo di file da confrontare perché --jobs distribuisca il lavoro su più
+# processi: sotto questa soglia l'avvio dei processi costa più del diff stesso
+PARALLEL_MIN_FILES = 64
+
+# Risorse parsate tenute in cache da load_resource: oltre questo numero le meno
+# recenti vengono riparsate se servono di nuovo, la memoria resta limitata
+RESOURCE_CACHE_SIZE = 1024
+
+# diff di sistema (Myers in C): per file grandi è molto più veloce di difflib,
+# che è puro Python. Sotto la soglia di righe l'avvio del processo costa di più
+DIFF_COMMAND = shutil.which('diff')
+EXTERNAL_DIFF_MIN_LINES = 1000
+
+
+def load_json(data: bytes | str):
+    """Parse JSON (bytes or str), using orjson when available."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def pretty_json(obj, sort_keys: bool = True) -> str:
+    """
+    Format an object as JSON with 2-space indentation (sorted keys by default).
+    
+    orjson produces the same layout as json.dumps(sort_keys=..., indent=2,
+    ensure_ascii=False); objects it cannot encode fall back to the stdlib.
+    """
+    if orjson is not None:
+        option = orjson.OPT_INDENT_2 | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        try:
+            return orjson.dumps(obj, option=option).decode('utf-8')
+        except TypeError:
+            pass
+    return json.dumps(obj, sort_keys=sort_keys, indent=2, ensure_ascii=False)
+
+
+def compact_json(obj) -> str:
+    """Format an object as compact JSON (no whitespace), for machine-read files."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj).decode('utf-8')
+        except TypeError:
+            pass
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+
+
+@lru_cache(maxsize=RESOURCE_CACHE_SIZE)
+def load_resource(p: Path):
+    """
+    Carica un file risorsa, una sola volta per processo (fino a RESOURCE_CACHE_SIZE file).
+    
+    compare e diff_details girano nello stesso processo e leggono gli stessi file
+    (solo quelli differenti): senza --jobs ogni file viene letto e parsato una
+    volta sola. Con --jobs > 1 la cache non è condivisa tra processi: un file
+    differente viene parsato dal worker di compare, dal worker di changed_fields
+    e di nuovo dal processo principale per il report.
+    L'oggetto restituito è condiviso e NON va modificato; la cache viene
+    svuotata all'inizio di compare.main e all'uscita di diff_details.main, e
+    all'uscita di compare.main se non è chiamato con keep_resources.
+    """
+    return load_json(p.read_bytes())
+
+
+def read_json_text(p: Path, canonical: bool = False):
     """
     Reads a JSON file and converts it to text lines for diff.
     
     Args:
         p: Path of JSON file to read
+        canonical: The file is already formatted like pretty_json (written by kdiff
+                   with --pretty-fetched): its lines are used as they are
     
     Returns:
         List of strings (lines) of consistently formatted JSON
@@ -46,16 +128,55 @@ def read_json_text(p: Path):
     This ensures identical diffs are not detected as different
     only due to different formatting (spazi, ordine chiavi, etc).
     """
+    if canonical:
+        # Same lines as pretty_json, apart from the trailing newline of the file
+        text = p.read_text(encoding='utf-8')
+        return (text[:-1] if text.endswith('\n') else text).splitlines(keepends=True)
     try:
-        txt = p.read_text(encoding='utf-8')
         # Normalize formatting for consistent diffs
-        obj = json.loads(txt)
-        return json.dumps(obj, sort_keys=True, indent=2, ensure_ascii=False).splitlines(keepends=True)
+        obj = load_resource(p)
+        return pretty_json(obj).splitlines(keepends=True)
     except Exception:
         # Fallback: read raw lines in case of parsing error
         return p.read_text(encoding='utf-8', errors='ignore').splitlines(keepends=True)
 
 
+def list_json_files(d: Path) -> set:
+    """
+    Nomi dei file di risorse (*.json) in una directory, con una sola lettura.
+    
+    Returns:
+        Set di nomi file (vuoto se la directory non esiste)
+    """
+    try:
+        with os.scandir(d) as entries:
+            return {e.name for e in entries if e.name.endswith('.json') and e.is_file()}
+    except FileNotFoundError:
+        return set()
+
+
+def read_index(d: Path) -> dict:
+    """
+    Legge l'indice degli hash di una directory di risorse.
+    
+    Args:
+        d: Directory di risorse scritta da kdiff
+    
+    Returns:
+        Dict nome file → hash del contenuto (vuoto se l'indice non esiste)
+    """
+    try:
+        text = (d / INDEX_NAME).read_text(encoding='utf-8')
+    except OSError:
+        return {}
+    index = {}
+    for line in text.splitlines():
+        name, sep, digest = line.partition('\t')
+        if sep:
+            index[name] = digest
+    return index
+
+
 def generate_configmap_diff(pth1: Path, pth2: Path) -> str:
     """
     Generate a more useful diff for ConfigMap by comparing data.* line by line.
@@ -93,8 +214,8 @@ def generate_configmap_diff(pth1: Path, pth2: Path) -> str:
     """
     try:
         # Load both ConfigMaps
-        obj1 = json.loads(pth1.read_text(encoding='utf-8'))
-        obj2 = json.loads(pth2.read_text(encoding='utf-8'))
+        obj1 = load_resource(pth1)
+        obj2 = load_resource(pth2)
         
         # Verify they are actually ConfigMaps
         if obj1.get('kind') != 'ConfigMap' or obj2.get('kind') != 'ConfigMap':
@@ -103,9 +224,13 @@ def generate_configmap_diff(pth1: Path, pth2: Path) -> str:
         # Estrai il field data da entrambi
         data1 = obj1.get('data', {})
         data2 = obj2.get('data', {})
+        # data identici (la differenza è in altri campi): un solo confronto tra
+        # dict, senza scorrere le chiavi → diff standard
+        if data1 == data2:
+            return None
         
         # Raccogli tutte le chiavi presenti in almeno uno dei due ConfigMap
-        all_keys = sorted(set(data1.keys()) | set(data2.keys()))
+        all_keys = sorted(data1.keys() | data2.keys())
         
         # Inizializza output diff
         diff_lines = []
@@ -148,7 +273,90 @@ def generate_configmap_diff(pth1: Path, pth2: Path) -> str:
         return None
 
 
-def main():
+def external_unified_diff(pth: Path, other: Path, a_lines, b_lines, canonical: bool = False):
+    """
+    Genera lo unified diff con il comando diff di sistema.
+    
+    Args:
+        pth: Path file cluster1 (usato anche come etichetta ---)
+        other: Path file cluster2 (usato anche come etichetta +++)
+        a_lines: Linee formattate del primo file
+        b_lines: Linee formattate del secondo file
+        canonical: I file su disco sono già formattati: diff li legge direttamente
+    
+    Returns:
+        Testo del diff, oppure None se diff non è disponibile o fallisce
+        (il chiamante ricade su difflib)
+    """
+    cmd = [DIFF_COMMAND, '-u', '--label', str(pth), '--label', str(other)]
+    try:
+        if canonical:
+            result = subprocess.run(cmd + [str(pth), str(other)], capture_output=True)
+        else:
+            with tempfile.TemporaryDirectory(prefix='kdiff-') as tmp:
+                a_file, b_file = Path(tmp) / 'a', Path(tmp) / 'b'
+                a_file.write_text(''.join(a_lines) + '\n', encoding='utf-8')
+                b_file.write_text(''.join(b_lines) + '\n', encoding='utf-8')
+                result = subprocess.run(cmd + [str(a_file), str(b_file)], capture_output=True)
+    except OSError:
+        return None
+    # Exit code 1 = file diversi; 0 non dovrebbe capitare (linee già diverse), 2 = errore
+    if result.returncode != 1:
+        return None
+    return result.stdout.decode('utf-8', errors='replace')
+
+
+def diff_pair(candidate) -> bool:
+    """
+    Confronta un file presente in entrambe le directory e scrive il suo .diff.
+    
+    Args:
+        candidate: Tupla (path cluster1, path cluster2, directory diffs, file canonici)
+    
+    Returns:
+        True se i contenuti sono diversi (file .diff scritto)
+    """
+    pth, other, diffs, canonical = candidate
+    outname = f"{pth.name.replace('/', '__')}.diff"
+    
+    # File identici byte per byte (caso più comune, anche senza indice degli hash):
+    # nessun parsing né diff. filecmp scarta subito file di dimensione diversa
+    if filecmp.cmp(pth, other, shallow=False):
+        return False
+    
+    # Prova prima con diff intelligente per ConfigMap (file canonici scritti da kdiff:
+    # il prefisso del nome è il kind, gli altri tipi non vengono nemmeno parsati)
+    configmap_diff = None
+    if not canonical or pth.name.startswith('configmap__'):
+        configmap_diff = generate_configmap_diff(pth, other)
+    
+    if configmap_diff:
+        # È un ConfigMap E ha differenze
+        (diffs / outname).write_text(configmap_diff, encoding='utf-8')
+        return True
+    
+    # Non è un ConfigMap OPPURE ConfigMap senza diff → usa diff standard
+    a_lines = read_json_text(pth, canonical)
+    b_lines = read_json_text(other, canonical)
+    
+    # Confronta linea per linea
+    if a_lines == b_lines:
+        return False
+    # Genera unified diff (-u style)
+    df = None
+    if DIFF_COMMAND and max(len(a_lines), len(b_lines)) >= EXTERNAL_DIFF_MIN_LINES:
+        df = external_unified_diff(pth, other, a_lines, b_lines, canonical)
+    if df is None:
+        df = ''.join(difflib.unified_diff(
+            a_lines, b_lines,
+            fromfile=str(pth),
+            tofile=str(other)
+        ))
+    (diffs / outname).write_text(df, encoding='utf-8')
+    return True
+
+
+def main(argv=None, keep_resources=False):
     """
     Entry point per confronto directory.
     
@@ -162,15 +370,17 @@ def main():
         5. Scansiona dir2 per file che non esistono in dir1 → missing_in_1
         6. Genera summary.json con statistiche
     
-    Args (via command line):
-        dir1: Directory con risorse cluster 1 (normalizzate)
-        dir2: Directory con risorse cluster 2 (normalizzate)
-        diffs: Directory output per file .diff
-        --json-out: Path per savesre summary.json
+    Args:
+        argv: Argomenti da riga di comando (default: sys.argv[1:])
+            dir1: Directory con risorse cluster 1 (normalizzate)
+            dir2: Directory con risorse cluster 2 (normalizzate)
+            diffs: Directory output per file .diff
+            --json-out: Path per savesre summary.json
+        keep_resources: Lascia in cache (load_resource) le risorse parsate, per
+            un diff_details.main eseguito subito dopo nello stesso processo
     
-    Exit code:
-        0: no differences rilevata
-        1: differences detected (normale quando ci sono diff)
+    Returns:
+        Exit code: 0 no differences rilevata, 1 differences detected (normale quando ci sono diff)
     """
     # ============================================
     # PARSING ARGOMENTI
@@ -184,131 +394,132 @@ def main():
     p.add_argument('diffs', help='Directory output per i file diff')
     p.add_argument('--json-out', dest='json_out', default=None,
                    help='Path per savesre summary.json')
-    args = p.parse_args()
+    p.add_argument('--jobs', type=int, default=1,
+                   help=f'Processi per il confronto dei file (usati da {PARALLEL_MIN_FILES} file da confrontare in su)')
+    p.add_argument('--canonical', action='store_true',
+                   help='I file sono già formattati con chiavi ordinate e indent=2 (kdiff --pretty-fetched): niente riformattazione')
+    args = p.parse_args(argv)
+    # Risorse di un'esecuzione precedente nello stesso processo
+    load_resource.cache_clear()
 
-    # Converti a Path per gestione filesystem
-    dir1 = Path(args.dir1)
-    dir2 = Path(args.dir2)
-    diffs = Path(args.diffs)
-    diffs.mkdir(parents=True, exist_ok=True)  # Crea directory se non esiste
+    try:
+        # Converti a Path per gestione filesystem
+        dir1 = Path(args.dir1)
+        dir2 = Path(args.dir2)
+        diffs = Path(args.diffs)
+        diffs.mkdir(parents=True, exist_ok=True)  # Crea directory se non esiste
 
-    # ============================================
-    # INIZIALIZZA LISTE RISULTATI
-    # ============================================
+        # ============================================
+        # INIZIALIZZA LISTE RISULTATI
+        # ============================================
     
-    missing_in_2 = []  # File presenti in cluster1 ma non in cluster2
-    missing_in_1 = []  # File presenti in cluster2 ma non in cluster1
-    different = []     # File presenti in entrambi ma con contenuto diverso
+        # Hash dei file (se kdiff li ha scritti): file con lo stesso hash sono identici
+        index1 = read_index(dir1)
+        index2 = read_index(dir2)
+    
+        candidates = []    # File presenti in entrambi, da confrontare (vedi diff_pair)
 
-    # ============================================
-    # SCANSIONE DIR1 (cluster 1)
-    # ============================================
+        # ============================================
+        # SCANSIONE DIRECTORY (cluster 1 e cluster 2)
+        # ============================================
+    
+        # Una lettura per directory: presenza/assenza dei file da operazioni tra insiemi,
+        # senza una stat() per file
+        files1 = list_json_files(dir1)
+        files2 = list_json_files(dir2)
+    
+        # Caso 1: file presenti in una sola directory
+        missing_in_2 = sorted(files1 - files2)
+        missing_in_1 = sorted(files2 - files1)
     
-    # Per ogni file JSON in dir1
-    for pth in sorted(dir1.glob('*.json')):
-        rel = pth.name  # Nome file relativo (es. "deployment__ns__myapp.json")
-        other = dir2 / rel  # Path corrispondente in dir2
-        
-        # Caso 1: file manca completamente in dir2
-        if not other.exists():
-            missing_in_2.append(rel)
-            continue
-        
         # Caso 2: file esiste in entrambi, compares contenuto
+        for rel in sorted(files1 & files2):
+            # Stesso hash nell'indice → contenuto identico, niente parsing né diff
+            digest = index1.get(rel)
+            if digest is not None and digest == index2.get(rel):
+                continue
         
-        # Prova prima con diff intelligente per ConfigMap
-        configmap_diff = generate_configmap_diff(pth, other)
-        
-        if configmap_diff:
-            # È un ConfigMap E ha differenze
-            different.append(rel)
-            outname = f"{rel.replace('/', '__')}.diff"
-            (diffs / outname).write_text(configmap_diff, encoding='utf-8')
+            candidates.append((dir1 / rel, dir2 / rel, diffs, args.canonical))
+    
+        # Confronto dei contenuti: difflib è puro Python e CPU-bound, con molti file
+        # il lavoro viene distribuito su più processi (l'ordine dei risultati è preservato)
+        if args.jobs > 1 and len(candidates) >= PARALLEL_MIN_FILES:
+            # 'spawn': il chiamante (kdiff) può avere thread attivi, fork non è sicuro
+            with ProcessPoolExecutor(max_workers=args.jobs, mp_context=multiprocessing.get_context('spawn')) as executor:
+                results = list(executor.map(diff_pair, candidates, chunksize=16))
         else:
-            # Non è un ConfigMap OPPURE ConfigMap senza diff → usa diff standard
-            a_lines = read_json_text(pth)
-            b_lines = read_json_text(other)
-            
-            # Confronta linea per linea
-            if a_lines != b_lines:
-                different.append(rel)
-                # Genera unified diff (-u style)
-                df = ''.join(difflib.unified_diff(
-                    a_lines, b_lines,
-                    fromfile=str(pth),
-                    tofile=str(other)
-                ))
-                outname = f"{rel.replace('/', '__')}.diff"
-                (diffs / outname).write_text(df, encoding='utf-8')
+            results = [diff_pair(candidate) for candidate in candidates]
+        different = [pth.name for (pth, *_), changed in zip(candidates, results) if changed]
 
-    # ============================================
-    # SCANSIONE DIR2 (cluster 2) per file mancanti in DIR1
-    # ============================================
+        # ============================================
+        # COSTRUZIONE SUMMARY JSON
+        # ============================================
     
-    for pth in sorted(dir2.glob('*.json')):
-        rel = pth.name
-        if not (dir1 / rel).exists():
-            missing_in_1.append(rel)
+        summary = {
+            'missing_in_2': missing_in_2,  # Risorse solo in cluster 1
+            'missing_in_1': missing_in_1,  # Risorse solo in cluster 2
+            'different': different,         # Risorse diverse tra i due cluster
+            'counts': {
+                'missing_in_2': len(missing_in_2),
+                'missing_in_1': len(missing_in_1),
+                'different': len(different),
+            },
+            'by_kind': {}  # Statistiche per tipo resource (deployment, configmap, etc)
+        }
 
-    # ============================================
-    # COSTRUZIONE SUMMARY JSON
-    # ============================================
-    
-    summary = {
-        'missing_in_2': missing_in_2,  # Risorse solo in cluster 1
-        'missing_in_1': missing_in_1,  # Risorse solo in cluster 2
-        'different': different,         # Risorse diverse tra i due cluster
-        'counts': {
-            'missing_in_2': len(missing_in_2),
-            'missing_in_1': len(missing_in_1),
-            'different': len(different),
-        },
-        'by_kind': {}  # Statistiche per tipo resource (deployment, configmap, etc)
-    }
-
-    # Helper per estrarre il kind dal nome file (es. "deployment__ns__app.json" → "deployment")
-    def kind_from_name(n):
-        return n.split('__', 1)[0] if '__' in n else 'unknown'
-
-    # Aggrega statistiche per kind
-    for k in set(missing_in_2 + missing_in_1 + different):
-        kind = kind_from_name(k)
-        bk = summary['by_kind'].setdefault(kind, {
-            'missing_in_2': 0,
-            'missing_in_1': 0,
-            'different': 0
-        })
-        if k in missing_in_2:
-            bk['missing_in_2'] += 1
-        if k in missing_in_1:
-            bk['missing_in_1'] += 1
-        if k in different:
-            bk['different'] += 1
+        # Helper per estrarre il kind dal nome file (es. "deployment__ns__app.json" → "deployment")
+        def kind_from_name(n):
+            return n.split('__', 1)[0] if '__' in n else 'unknown'
 
-    # ============================================
-    # SALVA SUMMARY JSON
-    # ============================================
+        # Aggrega statistiche per kind
+        for k in set(missing_in_2 + missing_in_1 + different):
+            kind = kind_from_name(k)
+            bk = summary['by_kind'].setdefault(kind, {
+                'missing_in_2': 0,
+                'missing_in_1': 0,
+                'different': 0
+            })
+            if k in missing_in_2:
+                bk['missing_in_2'] += 1
+            if k in missing_in_1:
+                bk['missing_in_1'] += 1
+            if k in different:
+                bk['different'] += 1
+
+        # ============================================
+        # SALVA SUMMARY JSON
+        # ============================================
     
-    if args.json_out:
-        Path(args.json_out).write_text(
-            json.dumps(summary, indent=2, ensure_ascii=False),
-            encoding='utf-8'
-        )
+        # Compatto: lo leggono diff_details/report (e l'automazione), con migliaia di
+        # risorse l'indentazione ne raddoppia dimensione e tempo di parsing
+        if args.json_out:
+            Path(args.json_out).write_text(
+                compact_json(summary),
+                encoding='utf-8'
+            )
 
-    # ============================================
-    # EXIT CODE
-    # ============================================
+        # ============================================
+        # EXIT CODE
+        # ============================================
     
-    # Exit 0 solo se NESSUNA differenza
-    if (summary['counts']['missing_in_2'] == 0 and
-        summary['counts']['missing_in_1'] == 0 and
-        summary['counts']['different'] == 0):
-        print('No differences detected')
-        sys.exit(0)
-    else:
-        print('Differences detected')
-        sys.exit(1)  # Normale quando ci sono differenze
+        # Exit 0 solo se NESSUNA differenza
+        if (summary['counts']['missing_in_2'] == 0 and
+            summary['counts']['missing_in_1'] == 0 and
+            summary['counts']['different'] == 0):
+            print('No differences detected')
+            return 0
+        else:
+            print('Differences detected')
+            return 1  # Normale quando ci sono differenze
 
+    except BaseException:
+        load_resource.cache_clear()
+        raise
+    finally:
+        # Le risorse restano in cache solo per il diff_details che segue nello
+        # stesso processo (keep_resources)
+        if not keep_resources:
+            load_resource.cache_clear()
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
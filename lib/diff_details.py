@@ -12,7 +12,7 @@ Input:
   - OUTDIR/diffs/*.diff: file diff già generati
 
 Output:
-  - diff-details.md: report markdown con tabelle differenze
+  - diff-details.md: report markdown con tabelle differenze (solo con --emit-markdown)
   - diff-details.json: dati strutturati per automazione
   - diff-details.html: report HTML interattivo con UI avanzata ⭐
 
@@ -33,16 +33,36 @@ Esempio:
   python3 lib/diff_details.py ./kdiff_output/20260103T153045Z
 """
 import argparse
+import base64
 import json
 from pathlib import Path
 import sys
 import html as html_lib
+import io
+import os
 import datetime
+import multiprocessing
 import typing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from operator import itemgetter
 
 # Import version from parent package
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 from lib import __version__
+from lib.compare import PARALLEL_MIN_FILES, list_json_files, load_json, load_resource, pretty_json
+
+# Parser JSON a eventi opzionale: legge solo l'inizio dei file risorsa grandi
+try:
+    import ijson
+except ImportError:  # pragma: no cover - depends on environment
+    ijson = None
+
+# File risorsa oltre questa dimensione: kind/name/namespace letti con ijson (se
+# disponibile) senza parsare il resto (es. CRD con schemi di diversi MB)
+IDENTITY_STREAM_MIN_BYTES = 256 * 1024
+SCALAR_EVENTS = frozenset(('string', 'number', 'boolean', 'null'))
 
 
 # ============================================
@@ -57,7 +77,7 @@ def flatten(obj: typing.Any, prefix: str = "") -> dict:
     
     Args:
         obj: Oggetto da appiattire (dict, list, o valore scalare)
-        prefix: Prefisso corrente del path (uso interno ricorsivo)
+        prefix: Prefisso dei path generati (vuoto per la radice)
     
     Returns:
         Dizionario con path come chiavi e valori scalari
@@ -75,24 +95,27 @@ def flatten(obj: typing.Any, prefix: str = "") -> dict:
         - Scalari: ritorna come coppia path:valore
     """
     out = {}
-    
-    if isinstance(obj, dict):
-        # Dizionario: processa ogni chiave ricorsivamente
-        for k, v in obj.items():
-            # Costruisci path: se prefix esiste usa "prefix.key", altrimenti solo "key"
-            p = f"{prefix}.{k}" if prefix else k
-            out.update(flatten(v, p))
-    
-    elif isinstance(obj, list):
-        # Lista: processa ogni elemento con indice
-        for i, v in enumerate(obj):
-            # Path con bracket notation: "path[0]", "path[1]", etc
-            p = f"{prefix}[{i}]"
-            out.update(flatten(v, p))
-    
-    else:
-        # Valore scalare (string, number, bool, None): aggiungi al risultato
-        out[prefix] = obj
+    # Visita iterativa con stack esplicito: niente ricorsione né dict intermedi
+    # da fondere a ogni livello. I figli sono impilati al contrario, così i path
+    # escono nello stesso ordine della visita ricorsiva
+    stack = [(obj, prefix)]
+    while stack:
+        o, p = stack.pop()
+        
+        if type(o) is dict:
+            # Dizionario: path "prefix.key", oppure solo "key" alla radice
+            if p:
+                stack.extend((v, p + "." + k) for k, v in reversed(o.items()))
+            else:
+                stack.extend((v, k) for k, v in reversed(o.items()))
+        
+        elif type(o) is list:
+            # Lista: path con bracket notation "path[0]", "path[1]", etc
+            stack.extend((o[i], p + "[" + str(i) + "]") for i in range(len(o) - 1, -1, -1))
+        
+        else:
+            # Valore scalare (string, number, bool, None): aggiungi al risultato
+            out[p] = o
     
     return out
 
@@ -131,6 +154,27 @@ def shortrepr(v):
     return s.replace("\n", "\\n")
 
 
+# Cella valore per un campo assente/null nel report HTML
+NULL_VALUE_HTML = '<span class="null-value" title="Not set">❌</span>'
+
+
+def value_html(v) -> str:
+    """
+    Formatta un valore per una cella della tabella campi modificati (HTML).
+    
+    Args:
+        v: Valore del campo (None se assente)
+    
+    Returns:
+        shortrepr del valore con HTML escape e newline reali (per il pre-wrap
+        CSS), oppure il segnaposto ❌ se il valore è None
+    """
+    if v is None:
+        return NULL_VALUE_HTML
+    return html_lib.escape(shortrepr(v)).replace('\\n', '\n')
+
+
+@lru_cache(maxsize=65536)
 def top_key_for_path(p: str) -> str:
     """
     Estrae la chiave di primo livello da un path nested.
@@ -149,21 +193,142 @@ def top_key_for_path(p: str) -> str:
     
     Uso: Aggregare statistiche per chiave di primo livello
           (quanti campi spec.* sono cambiati, quanti metadata.*, etc)
+    
+    Memoizzata: gira per ogni campo modificato e gli stessi path si ripetono
+    tra le risorse dello stesso tipo (cache limitata, chiavi solo stringhe)
+    """
+    # Taglia al primo '.' o '[' (gira per ogni campo modificato: due str.find
+    # costano meno di uno split con regex e della lista che crea)
+    end = len(p)
+    dot = p.find('.')
+    if dot != -1:
+        end = dot
+    bracket = p.find('[', 0, end)
+    if bracket != -1:
+        end = bracket
+    return p[:end]
+
+
+def changed_fields(pair) -> tuple:
+    """
+    Confronta campo per campo la stessa risorsa nei due cluster.
+    
+    Funzione di modulo: main la esegue anche in processi separati (--jobs).
+    
+    Args:
+        pair: Tupla (path file cluster1, path file cluster2)
+    
+    Returns:
+        Tupla (kind, name, changed) con changed lista di (path, valore_a, valore_b)
+        ordinata per path; None indica un campo assente
     """
-    import re
+    f1, f2 = pair
+    a = load_resource(f1)  # Risorsa cluster1
+    b = load_resource(f2)  # Risorsa cluster2
     
-    # Split su '.' o '[' per isolare il primo token
-    # Regex: split su punto O parentesi quadra aperta
-    m = re.split(r"[.\[]", p)
+    # Estrai metadati per identificazione
+    kind = a.get('kind', 'Unknown')
+    name = a.get('metadata', {}).get('name', 'unknown')
     
-    # Ritorna primo token, oppure path originale se split fallisce
-    return m[0] if m else p
+    # Converte JSON annidato in percorsi piatti (es. "spec.replicas": 3), saltando
+    # le chiavi di primo livello uguali nei due cluster (spesso le più grandi, es.
+    # status): il confronto == tra oggetti parsati non costruisce nessun path
+    fa = {}
+    fb = {}
+    for key in a.keys() | b.keys():
+        if key in a and key in b and a[key] == b[key]:
+            continue
+        if key in a:
+            fa.update(flatten(a[key], key))
+        if key in b:
+            fb.update(flatten(b[key], key))
+    
+    # Registra ogni campo con valori differenti: una passata su fa, poi le chiavi
+    # presenti solo in fb (un campo assente vale None). Si ordina solo changed,
+    # di solito molto più corto dell'unione delle chiavi
+    changed = []
+    for k, va in fa.items():
+        vb = fb.get(k)
+        if va != vb:
+            changed.append((k, va, vb))
+    for k, vb in fb.items():
+        if vb is not None and k not in fa:
+            changed.append((k, None, vb))
+    changed.sort(key=itemgetter(0))
+    return kind, name, changed
+
+
+def write_details_json(path: Path, json_output: dict):
+    """
+    Scrive diff-details.json un elemento di "details" alla volta.
+    
+    Stesso testo di pretty_json(json_output, sort_keys=False), ma senza
+    costruire in memoria la stringa dell'intero report: con migliaia di
+    risorse diverse è grande quanto tutti i valori cambiati messi insieme.
+    
+    Args:
+        path: File di output
+        json_output: Report con la chiave "details" (lista di dict)
+    """
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write("{")
+        for n, (key, value) in enumerate(json_output.items()):
+            fh.write(f'{"," if n else ""}\n  {pretty_json(key)}: ')
+            if key == "details" and value:
+                # Ogni elemento indentato di un livello in più (dentro la lista)
+                fh.write("[")
+                for i, detail in enumerate(value):
+                    fh.write(("," if i else "") + "\n    " + pretty_json(detail, sort_keys=False).replace("\n", "\n    "))
+                fh.write("\n  ]")
+            else:
+                fh.write(pretty_json(value, sort_keys=False).replace("\n", "\n  "))
+        fh.write("\n}")
+
+
+def read_pretty_json(p: Path) -> str:
+    """
+    Legge un file risorsa e lo restituisce formattato per la visualizzazione.
+    
+    Args:
+        p: Path del file JSON (scritto compatto da kdiff, o indentato con --pretty-fetched)
+    
+    Returns:
+        JSON indentato (sort_keys, indent=2), oppure il testo grezzo se il parsing fallisce
+    
+    Uso: Contenuti mostrati nel side-by-side diff del report HTML
+    """
+    try:
+        # Senza --jobs è lo stesso oggetto già parsato da compare (vedi load_resource)
+        return pretty_json(load_resource(p)) + "\n"
+    except ValueError:
+        return p.read_text(encoding='utf-8')
 
 
 # ============================================
 # COLOR SCHEME - Palette Colori Risorse K8s
 # ============================================
 
+# Colore di ogni Kind (vedi get_kind_color)
+KIND_COLORS = {
+    'Deployment': '#2563eb',      # blu - workload principale
+    'StatefulSet': '#7c3aed',     # viola - app stateful
+    'DaemonSet': '#ea580c',       # arancione - agent system-wide
+    'Service': '#0891b2',         # cyan - networking
+    'ConfigMap': '#059669',       # verde - configurazione
+    'Secret': '#dc2626',          # rosso - credenziali
+    'Ingress': '#db2777',         # rosa - routing HTTP
+    'PersistentVolumeClaim': '#ca8a04',  # giallo-scuro - storage
+    'ServiceAccount': '#475569',  # slate - identity
+    'Role': '#4f46e5',            # indigo - RBAC role
+    'RoleBinding': '#7c2d12',     # arancione-scuro - RBAC binding
+    'HorizontalPodAutoscaler': '#0e7490',  # cyan-scuro - autoscaling
+    'CronJob': '#15803d',         # verde-scuro - scheduled jobs
+    'Job': '#166534',             # verde-più-scuro - one-off jobs
+    'ReplicaSet': '#6366f1',      # indigo-chiaro - replica management
+    'Pod': '#9333ea',             # viola-chiaro - pod standalone
+}
+
+
 def get_kind_color(kind: str) -> str:
     """
     Ritorna un colore HEX univoco per ogni tipo di risorsa Kubernetes.
@@ -190,29 +355,32 @@ def get_kind_color(kind: str) -> str:
     
     Nota: totale 16 colori distinti + 1 default gray per tipi sconosciuti
     """
-    colors = {
-        'Deployment': '#2563eb',      # blu - workload principale
-        'StatefulSet': '#7c3aed',     # viola - app stateful
-        'DaemonSet': '#ea580c',       # arancione - agent system-wide
-        'Service': '#0891b2',         # cyan - networking
-        'ConfigMap': '#059669',       # verde - configurazione
-        'Secret': '#dc2626',          # rosso - credenziali
-        'Ingress': '#db2777',         # rosa - routing HTTP
-        'PersistentVolumeClaim': '#ca8a04',  # giallo-scuro - storage
-        'ServiceAccount': '#475569',  # slate - identity
-        'Role': '#4f46e5',            # indigo - RBAC role
-        'RoleBinding': '#7c2d12',     # arancione-scuro - RBAC binding
-        'HorizontalPodAutoscaler': '#0e7490',  # cyan-scuro - autoscaling
-        'CronJob': '#15803d',         # verde-scuro - scheduled jobs
-        'Job': '#166534',             # verde-più-scuro - one-off jobs
-        'ReplicaSet': '#6366f1',      # indigo-chiaro - replica management
-        'Pod': '#9333ea',             # viola-chiaro - pod standalone
-    }
-    
     # Default: grigio per tipi non mappati
-    return colors.get(kind, '#374151')
+    return KIND_COLORS.get(kind, '#374151')
+
 
+# Palette di colori solidi vibranti e distinti per i namespace (vedi get_namespace_color)
+NAMESPACE_COLORS = (
+    "#667eea",  # indigo
+    "#f56565",  # red
+    "#38b2ac",  # teal
+    "#48bb78",  # green
+    "#ed8936",  # orange
+    "#9f7aea",  # purple
+    "#ed64a6",  # pink
+    "#4299e1",  # blue
+    "#ecc94b",  # yellow
+    "#f687b3",  # light pink
+    "#4fd1c5",  # cyan
+    "#fc8181",  # light red
+    "#9ae6b4",  # light green
+    "#fbd38d",  # light orange
+    "#a78bfa",  # light purple
+    "#63b3ed",  # light blue
+)
 
+
+@lru_cache(maxsize=256)
 def get_namespace_color(namespace: str) -> str:
     """
     Ritorna un colore solido univoco per ogni namespace.
@@ -234,36 +402,105 @@ def get_namespace_color(namespace: str) -> str:
     # Hash del namespace per ottenere un indice consistente
     hash_value = sum(ord(c) for c in namespace)
     
-    # Palette di colori solidi vibranti e distinti
-    colors = [
-        "#667eea",  # indigo
-        "#f56565",  # red
-        "#38b2ac",  # teal
-        "#48bb78",  # green
-        "#ed8936",  # orange
-        "#9f7aea",  # purple
-        "#ed64a6",  # pink
-        "#4299e1",  # blue
-        "#ecc94b",  # yellow
-        "#f687b3",  # light pink
-        "#4fd1c5",  # cyan
-        "#fc8181",  # light red
-        "#9ae6b4",  # light green
-        "#fbd38d",  # light orange
-        "#a78bfa",  # light purple
-        "#63b3ed",  # light blue
-    ]
-    
     # Seleziona colore basato su hash
-    index = hash_value % len(colors)
-    return colors[index]
+    index = hash_value % len(NAMESPACE_COLORS)
+    return NAMESPACE_COLORS[index]
 
 
 # ============================================
 # MISSING RESOURCES TABLE - Risorse Esclusive
 # ============================================
 
-def generate_missing_resources_table(summary, cluster1, cluster2, c1_dir, c2_dir):
+@lru_cache(maxsize=4096)
+def resource_identity(path: Path) -> tuple | None:
+    """
+    Legge kind, name e namespace di un file risorsa.
+    
+    A differenza di load_resource non tiene in memoria l'oggetto intero: le
+    risorse presenti in un solo cluster servono solo per la tabella dei mancanti.
+    
+    Args:
+        path: Path del file JSON
+    
+    Returns:
+        Tupla (kind, name, namespace), oppure None se il file manca o non è leggibile
+    """
+    try:
+        with open(path, 'rb') as fh:
+            if ijson is not None and os.fstat(fh.fileno()).st_size >= IDENTITY_STREAM_MIN_BYTES:
+                return peek_resource_identity(fh)
+            obj = load_json(fh.read())
+        metadata = obj.get('metadata', {})
+        return obj.get('kind', 'Unknown'), metadata.get('name', 'unknown'), metadata.get('namespace', '-')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peek_resource_identity(fh) -> tuple | None:
+    """
+    Legge kind, name e namespace da un file risorsa aperto, a eventi (ijson).
+    
+    I file scritti da kdiff hanno le chiavi ordinate: "kind" e "metadata"
+    precedono "spec" e "status", quindi la lettura si ferma alla fine di
+    metadata senza parsare il resto del file.
+    
+    Args:
+        fh: File binario posizionato all'inizio
+    
+    Returns:
+        Tupla (kind, name, namespace), oppure None se il documento non è un oggetto
+    """
+    kind, name, namespace = None, 'unknown', '-'
+    try:
+        events = ijson.parse(fh, use_float=True)
+        if next(events, (None, None, None))[1] != 'start_map':
+            return None
+        for prefix, event, value in events:
+            if event in SCALAR_EVENTS:
+                if prefix == 'kind':
+                    kind = value
+                elif prefix == 'metadata.name':
+                    name = value
+                elif prefix == 'metadata.namespace':
+                    namespace = value
+            elif prefix == 'metadata' and event == 'end_map' and kind is not None:
+                # kind già letto (chiavi ordinate): il resto del file non serve
+                break
+    except ijson.JSONError:
+        return None
+    return kind if kind is not None else 'Unknown', name, namespace
+
+
+# Apertura e chiusura della tabella risorse mancanti (le righe stanno in mezzo)
+MISSING_TABLE_HEAD = '''
+        <table class="missing-table">
+            <thead>
+                <tr>
+                    <th>Type</th>
+                    <th>Name</th>
+                    <th>Namespace</th>
+                    <th>Location</th>
+                </tr>
+            </thead>
+            <tbody>
+                '''
+MISSING_TABLE_TAIL = '''
+            </tbody>
+        </table>
+    '''
+
+
+# Riga della tabella campi modificati: una riga compatta per campo, senza
+# l'indentazione del resto del template (le righe sono la parte più numerosa)
+DIFF_ROW_FORMAT = (
+    '\n<tr class="%s"><td class="col-icon">%s</td>'
+    '<td class="col-path"><code>%s</code></td>'
+    '<td class="col-value"><code>%s</code></td>'
+    '<td class="col-value"><code>%s</code></td></tr>'
+)
+
+
+def generate_missing_resources_table(summary, cluster1, cluster2, c1_dir, c2_dir, c1_files=None, c2_files=None):
     """
     Genera tabella HTML per risorse presenti solo in un cluster.
     
@@ -273,6 +510,8 @@ def generate_missing_resources_table(summary, cluster1, cluster2, c1_dir, c2_dir
         cluster2: Name secondo cluster
         c1_dir: Path directory risorse cluster 1
         c2_dir: Path directory risorse cluster 2
+        c1_files: Nomi dei file in c1_dir (list_json_files), opzionale
+        c2_files: Nomi dei file in c2_dir (list_json_files), opzionale
     
     Returns:
         Stringa HTML con tabella formattata
@@ -303,61 +542,27 @@ def generate_missing_resources_table(summary, cluster1, cluster2, c1_dir, c2_dir
     if not missing_in_c2 and not missing_in_c1:
         return '<p style="color: #6b7280; font-style: italic;">No resources found exclusively in one cluster.</p>'
     
-    # Lista per raccogliere tutte le risorse con i loro metadati per l'ordinamento
+    # Tuple (kind, name, namespace, color, location, location_class) per l'ordinamento
     all_resources = []
     
-    # ========================================
-    # Risorse presenti SOLO in cluster1
-    # ========================================
-    for resource_file in missing_in_c2:
-        try:
-            resource_path = c1_dir / resource_file
-            if resource_path.exists():
-                # Carica risorsa per estrarre metadati
-                with open(resource_path) as file:
-                    obj = json.load(file)
-                kind = obj.get('kind', 'Unknown')
-                name = obj.get('metadata', {}).get('name', 'unknown')
-                namespace = obj.get('metadata', {}).get('namespace', '-')
-                color = get_kind_color(kind)
-                
-                all_resources.append({
-                    'kind': kind,
-                    'name': name,
-                    'namespace': namespace,
-                    'color': color,
-                    'location': f'Only in {cluster1}',
-                    'location_class': 'missing-in-c2'
-                })
-        except Exception:
-            # Ignora errori (file corrotto, JSON invalido, etc)
-            pass
+    # Risorse presenti SOLO in cluster1 (missing_in_2) e SOLO in cluster2 (missing_in_1)
+    # (se i nomi dei file sono noti, quelli assenti non vengono neppure aperti)
+    sources = [(c1_dir / f, f'Only in {cluster1}', 'missing-in-c2') for f in missing_in_c2
+               if c1_files is None or f in c1_files]
+    sources += [(c2_dir / f, f'Only in {cluster2}', 'missing-in-c1') for f in missing_in_c1
+                if c2_files is None or f in c2_files]
+    if not sources:
+        return '<p style="color: #6b7280; font-style: italic;">Unable to read resource details.</p>'
     
-    # ========================================
-    # Risorse presenti SOLO in cluster2
-    # ========================================
-    for resource_file in missing_in_c1:
-        try:
-            resource_path = c2_dir / resource_file
-            if resource_path.exists():
-                with open(resource_path) as file:
-                    obj = json.load(file)
-                kind = obj.get('kind', 'Unknown')
-                name = obj.get('metadata', {}).get('name', 'unknown')
-                namespace = obj.get('metadata', {}).get('namespace', '-')
-                color = get_kind_color(kind)
-                
-                all_resources.append({
-                    'kind': kind,
-                    'name': name,
-                    'namespace': namespace,
-                    'color': color,
-                    'location': f'Only in {cluster2}',
-                    'location_class': 'missing-in-c1'
-                })
-        except (IOError, json.JSONDecodeError, KeyError):
-            # Ignore unreadable or malformed resource files
-            pass
+    # Letture dei file in parallelo (l'I/O rilascia il GIL); file assenti o
+    # illeggibili (corrotti, JSON invalido) vengono ignorati
+    with ThreadPoolExecutor(max_workers=min(16, len(sources))) as executor:
+        identities = executor.map(resource_identity, (path for path, _, _ in sources))
+        for (_, location, location_class), identity in zip(sources, identities):
+            if identity is None:
+                continue
+            kind, name, namespace = identity
+            all_resources.append((kind, name, namespace, get_kind_color(kind), location, location_class))
     
     # Caso 2: errori lettura file (nessuna risorsa generata)
     if not all_resources:
@@ -366,43 +571,35 @@ def generate_missing_resources_table(summary, cluster1, cluster2, c1_dir, c2_dir
     # ========================================
     # ORDINAMENTO: per tipo (kind) alfabetico crescente (A->Z)
     # ========================================
-    all_resources.sort(key=lambda x: x['kind'])
+    all_resources.sort(key=itemgetter(0))
     
-    # Genera le righe HTML dalle risorse ordinate
-    rows = []
-    for res in all_resources:
-        rows.append(f'''
+    # Genera le righe HTML dalle risorse ordinate, scritte in un unico buffer
+    # (niente lista di righe da unire e ricopiare nella tabella). I valori
+    # vengono dai file e dai nomi dei cluster: escape HTML
+    buf = io.StringIO()
+    for kind, name, namespace, color, location, location_class in all_resources:
+        kind = html_lib.escape(kind)
+        name = html_lib.escape(name)
+        namespace = html_lib.escape(namespace)
+        location = html_lib.escape(location)
+        buf.write(f'''
             <tr>
-                <td><span class="kind-badge" style="background: {res['color']};">{res['kind']}</span></td>
-                <td><strong>{res['name']}</strong></td>
-                <td>{res['namespace']}</td>
-                <td><span class="missing-badge {res['location_class']}">{res['location']}</span></td>
+                <td><span class="kind-badge" style="background: {color};">{kind}</span></td>
+                <td><strong>{name}</strong></td>
+                <td>{namespace}</td>
+                <td><span class="missing-badge {location_class}">{location}</span></td>
             </tr>
         ''')
     
     # Caso 3: genera tabella HTML completa
-    return f'''
-        <table class="missing-table">
-            <thead>
-                <tr>
-                    <th>Type</th>
-                    <th>Name</th>
-                    <th>Namespace</th>
-                    <th>Location</th>
-                </tr>
-            </thead>
-            <tbody>
-                {''.join(rows)}
-            </tbody>
-        </table>
-    '''
+    return MISSING_TABLE_HEAD + buf.getvalue() + MISSING_TABLE_TAIL
 
 
 # ============================================
 # MAIN - Elaborazione Principale
 # ============================================
 
-def main():
+def main(argv=None):
     """
     Funzione principale: elabora summary.json e genera report dettagliato.
     
@@ -414,21 +611,21 @@ def main():
            - Aggrega differenze per top-level key
         3. Genera statistiche (top fields modificati)
         4. Produce output:
-           - diff-details.md (Markdown)
+           - diff-details.md (Markdown, con --emit-markdown)
            - diff-details.json (JSON)
            - diff-details.html (HTML interattivo)
     
-    Args (da CLI):
-        outdir: Directory output con summary.json e sottodirectory cluster
-        --cluster1: Name primo cluster (default: "cluster1")
-        --cluster2: Name secondo cluster (default: "cluster2")
+    Args:
+        argv: Argomenti da riga di comando (default: sys.argv[1:])
+            outdir: Directory output con summary.json e sottodirectory cluster
+            --cluster1: Name primo cluster (default: "cluster1")
+            --cluster2: Name secondo cluster (default: "cluster2")
     
-    Exit codes:
-        0: Successo
-        2: summary.json non trovato
+    Returns:
+        Exit code: 0 successo, 2 summary.json non trovato
     
     Output files:
-        - diff-details.md: Report Markdown testuale
+        - diff-details.md: Report Markdown testuale (solo con --emit-markdown)
         - diff-details.json: Dati strutturati per integrazione
         - diff-details.html: Report HTML interattivo con zoom/modal
     """
@@ -438,201 +635,201 @@ def main():
     # ========================================
     p = argparse.ArgumentParser()
     p.add_argument("outdir", help="Output directory where summary.json and cluster directories exist")
-    p.add_argument('--cluster1', default='cluster1', help='Directory name for cluster1 resources')
-    p.add_argument('--cluster2', default='cluster2', help='Directory name for cluster2 resources')
+    p.add_argument('--cluster1', default='cluster1', help='Directory name for cluster1 resources (relative to outdir, or absolute path)')
+    p.add_argument('--cluster2', default='cluster2', help='Directory name for cluster2 resources (relative to outdir, or absolute path)')
     p.add_argument('--cluster1-label', default=None, help='Display label for cluster1 (defaults to --cluster1)')
     p.add_argument('--cluster2-label', default=None, help='Display label for cluster2 (defaults to --cluster2)')
-    args = p.parse_args()
+    p.add_argument('--jobs', type=int, default=1,
+                   help=f'Processes comparing resources field by field (used from {PARALLEL_MIN_FILES} differing resources up)')
+    p.add_argument('--emit-markdown', action='store_true',
+                   help='Also write diff-details.md (Markdown tables of the changed paths)')
+    args = p.parse_args(argv)
     
-    # Use labels if provided, otherwise use directory names
-    cluster1_label = args.cluster1_label if args.cluster1_label else args.cluster1
-    cluster2_label = args.cluster2_label if args.cluster2_label else args.cluster2
+    try:
+        # Use labels if provided, otherwise use directory names
+        cluster1_label = args.cluster1_label if args.cluster1_label else args.cluster1
+        cluster2_label = args.cluster2_label if args.cluster2_label else args.cluster2
     
-    # ========================================
-    # 2. VALIDAZIONE FILE INPUT
-    # ========================================
-    outdir = Path(args.outdir)
-    summary_file = outdir / "summary.json"
+        # ========================================
+        # 2. VALIDAZIONE FILE INPUT
+        # ========================================
+        outdir = Path(args.outdir)
+        summary_file = outdir / "summary.json"
     
-    if not summary_file.exists():
-        print(f"Summary not found: {summary_file}", file=sys.stderr)
-        sys.exit(2)
-
-    # Carica summary.json (contiene liste different/missing_in_1/missing_in_2)
-    with open(summary_file) as fh:
-        summary = json.load(fh)
+        # Carica summary.json (contiene liste different/missing_in_1/missing_in_2)
+        try:
+            summary = load_json(summary_file.read_bytes())
+        except FileNotFoundError:
+            print(f"Summary not found: {summary_file}", file=sys.stderr)
+            return 2
 
-    # Directory contenenti risorse normalizzate dei due cluster
-    c1_dir = outdir / args.cluster1
-    c2_dir = outdir / args.cluster2
+        # Directory contenenti risorse normalizzate dei due cluster
+        c1_dir = outdir / args.cluster1
+        c2_dir = outdir / args.cluster2
+        # Nomi dei file presenti: una scansione per directory invece di una stat per risorsa
+        c1_files = list_json_files(c1_dir)
+        c2_files = list_json_files(c2_dir)
     
-    # Diffs directory
-    diffs_dir = outdir / 'diffs'
+        # Diffs directory
+        diffs_dir = outdir / 'diffs'
 
-    # ========================================
-    # 3. INIZIALIZZAZIONE OUTPUT MARKDOWN
-    # ========================================
-    md_lines = []
-    md_lines.append("# kdiff — Detailed field-level differences")
-    md_lines.append(f"**Clusters:** {args.cluster1} vs {args.cluster2}")
-    md_lines.append(f"Generated on: {datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}")
-    md_lines.append("\n**Legend:**")
-    md_lines.append("- 🔄 Value changed")
-    md_lines.append("- ➕ Added in {args.cluster2} (not in {args.cluster1})")
-    md_lines.append("- ➖ Removed in {args.cluster2} (exists in {args.cluster1})")
-    md_lines.append("- ❌ (not set) = field not present or null")
-    md_lines.append("\n---\n")
+        # ========================================
+        # 3. INIZIALIZZAZIONE OUTPUT MARKDOWN
+        # ========================================
+        # Solo con --emit-markdown: altrimenti nessuna riga (né shortrepr) viene prodotta
+        md_lines = [] if args.emit_markdown else None
+        if md_lines is not None:
+            md_lines.append("# kdiff — Detailed field-level differences")
+            md_lines.append(f"**Clusters:** {args.cluster1} vs {args.cluster2}")
+            md_lines.append(f"Generated on: {datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}")
+            md_lines.append("\n**Legend:**")
+            md_lines.append("- 🔄 Value changed")
+            md_lines.append(f"- ➕ Added in {args.cluster2} (not in {args.cluster1})")
+            md_lines.append(f"- ➖ Removed in {args.cluster2} (exists in {args.cluster1})")
+            md_lines.append("- ❌ (not set) = field not present or null")
+            md_lines.append("\n---\n")
 
-    # ========================================
-    # 4. INIZIALIZZAZIONE CONTATORI E STRUTTURE DATI
-    # ========================================
-    details = []          # Lista dettagli per ogni risorsa differente
-    counts_top = {}       # Dizionario: top-level key → conteggio modifiche
-    total_resources = 0   # Contatore risorse elaborate
-    total_paths = 0       # Contatore totale campi modificati
+        # ========================================
+        # 4. INIZIALIZZAZIONE CONTATORI E STRUTTURE DATI
+        # ========================================
+        details = []          # Lista dettagli per ogni risorsa differente
+        counts_top = Counter()  # Contatore: top-level key → conteggio modifiche
+        total_resources = 0   # Contatore risorse elaborate
+        total_paths = 0       # Contatore totale campi modificati
 
-    # ========================================
-    # 5. ELABORAZIONE RISORSE DIFFERENTI
-    # ========================================
-    # Cicla su ogni risorsa marcata come "different" nel summary.json
-    for entry in summary.get("different", []):
-        total_resources += 1
-        base = Path(entry).name  # Name file (es. "deployment__default__myapp.json")
-        f1 = c1_dir / base
-        f2 = c2_dir / base
-
-        # ----------------------------------------
-        # 5.1 Validazione File
-        # ----------------------------------------
-        # Se file mancante in un cluster: segnala e continua
-        if not f1.exists() or not f2.exists():
-            md_lines.append(f"### {base}\n")
-            md_lines.append("**Skipping**: file missing in one cluster.\n")
-            details.append({"file": base, "changed": []})
-            continue
+        # ========================================
+        # 5. ELABORAZIONE RISORSE DIFFERENTI
+        # ========================================
+        # Coppie di file da confrontare (quelle con un file mancante sono solo segnalate)
+        bases = [Path(entry).name for entry in summary.get("different", [])]  # es. "deployment__default__myapp.json"
+        pairs = [(c1_dir / base, c2_dir / base) for base in bases
+                 if base in c1_files and base in c2_files]
+        if args.jobs > 1 and len(pairs) >= PARALLEL_MIN_FILES:
+            # Parsing + flatten + confronto sono indipendenti per risorsa: processi separati
+            # ('spawn' come in compare: il chiamante può avere thread attivi)
+            with ProcessPoolExecutor(max_workers=args.jobs, mp_context=multiprocessing.get_context('spawn')) as executor:
+                results = dict(zip((f1.name for f1, _ in pairs), executor.map(changed_fields, pairs, chunksize=16)))
+        else:
+            results = {f1.name: changed_fields((f1, f2)) for f1, f2 in pairs}
 
-        # ----------------------------------------
-        # 5.2 Caricamento Risorse JSON
-        # ----------------------------------------
-        with open(f1) as file1, open(f2) as file2:
-            a = json.load(file1)  # Risorsa cluster1
-            b = json.load(file2)  # Risorsa cluster2
-        
-        # Estrai metadati per identificazione
-        kind = a.get('kind', 'Unknown')
-        name = a.get('metadata', {}).get('name', 'unknown')
-        color = get_kind_color(kind)
-        
-        # Aggiungi header risorsa al Markdown
-        md_lines.append(f'### <span style="color: {color}; font-weight: bold;">Kind: {kind} | Name: {name}</span> <span style="color: #6b7280; font-size: 0.9em;">({base})</span>\n')
-        
-        # ----------------------------------------
-        # 5.3 Appiattimento JSON (flatten)
-        # ----------------------------------------
-        # Converte JSON annidato in percorsi piatti (es. "spec.replicas": 3)
-        fa = flatten(a)
-        fb = flatten(b)
-        
-        # Unisci tutte le chiavi presenti in entrambi
-        keys = sorted(set(fa.keys()) | set(fb.keys()))
-        
-        # ----------------------------------------
-        # 5.4 Confronto Campo per Campo
-        # ----------------------------------------
-        changed = []  # Lista tuple: (percorso, valore_a, valore_b)
-        
-        for k in keys:
-            va = fa.get(k, None)
-            vb = fb.get(k, None)
-            
-            # Se valori differenti: registra modifica
-            if va != vb:
-                changed.append((k, va, vb))
-                
-                # Aggrega per top-level key (es. "spec", "metadata", etc)
-                tk = top_key_for_path(k)
-                counts_top[tk] = counts_top.get(tk, 0) + 1
+        # Cicla su ogni risorsa marcata come "different" nel summary.json
+        for base in bases:
+            total_resources += 1
+
+            # ----------------------------------------
+            # 5.1 Validazione File
+            # ----------------------------------------
+            # Se file mancante in un cluster: segnala e continua
+            if base not in results:
+                if md_lines is not None:
+                    md_lines.append(f"### {base}\n")
+                    md_lines.append("**Skipping**: file missing in one cluster.\n")
+                details.append({"file": base, "changed": []})
+                continue
+
+            # ----------------------------------------
+            # 5.2 Risultato del confronto (vedi changed_fields)
+            # ----------------------------------------
+            kind, name, changed = results[base]
         
-        # ----------------------------------------
-        # 5.5 Generazione Output Markdown
-        # ----------------------------------------
-        md_lines.append(f"**Changed paths:** {len(changed)}\n")
+            # Aggiungi header risorsa al Markdown
+            if md_lines is not None:
+                color = get_kind_color(kind)
+                md_lines.append(f'### <span style="color: {color}; font-weight: bold;">Kind: {kind} | Name: {name}</span> <span style="color: #6b7280; font-size: 0.9em;">({base})</span>\n')
         
-        if not changed:
-            md_lines.append("No scalar differences detected.\n")
-        else:
-            # Tabella Markdown con 3 colonne
-            md_lines.append(f"| Path | {args.cluster1} | {args.cluster2} |")
-            md_lines.append("|---|---|---|")
-            
-            for pth, va, vb in changed:
-                # Indicatori visivi per tipo modifica:
-                # ➕ = Campo aggiunto in cluster2
-                # ➖ = Campo rimosso in cluster2
-                # 🔄 = Valore modificato
-                if va is None and vb is not None:
-                    indicator = "➕"
-                elif va is not None and vb is None:
-                    indicator = "➖"
-                else:
-                    indicator = "🔄"
-                
-                # Formatta riga tabella con valori abbreviati
-                md_lines.append(f"| {indicator} `{pth}` | `{shortrepr(va)}` | `{shortrepr(vb)}` |")
+            # Aggrega per top-level key (es. "spec", "metadata", etc): un update per risorsa
+            counts_top.update(top_key_for_path(k) for k, _, _ in changed)
         
-        md_lines.append("\n")
-        total_paths += len(changed)
+            # ----------------------------------------
+            # 5.3 Generazione Output Markdown
+            # ----------------------------------------
+            if md_lines is not None:
+                md_lines.append(f"**Changed paths:** {len(changed)}\n")
         
-        # Salva dettagli strutturati per JSON output
-        details.append({
-            "file": base,
-            "changed": [{"path": p, "a": fa.get(p), "b": fb.get(p)} for (p, a, b) in changed]
-        })
+                if not changed:
+                    md_lines.append("No scalar differences detected.\n")
+                else:
+                    # Tabella Markdown con 3 colonne
+                    md_lines.append(f"| Path | {args.cluster1} | {args.cluster2} |")
+                    md_lines.append("|---|---|---|")
+            
+                    for pth, va, vb in changed:
+                        # Indicatori visivi per tipo modifica:
+                        # ➕ = Campo aggiunto in cluster2
+                        # ➖ = Campo rimosso in cluster2
+                        # 🔄 = Valore modificato
+                        if va is None and vb is not None:
+                            indicator = "➕"
+                        elif va is not None and vb is None:
+                            indicator = "➖"
+                        else:
+                            indicator = "🔄"
+                
+                        # Formatta riga tabella con valori abbreviati
+                        md_lines.append(f"| {indicator} `{pth}` | `{shortrepr(va)}` | `{shortrepr(vb)}` |")
+        
+                md_lines.append("\n")
+            total_paths += len(changed)
+        
+            # Salva dettagli strutturati per JSON output. I path si ripetono tra risorse
+            # dello stesso tipo (es. "spec.template.spec.containers[0].image"): interned,
+            # details ne tiene una sola copia
+            details.append({
+                "file": base,
+                "changed": [{"path": sys.intern(p), "a": va, "b": vb} for (p, va, vb) in changed]
+            })
 
-    # ========================================
-    # 6. GENERAZIONE SUMMARY MARKDOWN
-    # ========================================
-    md_lines.append("\n---\n")
-    md_lines.append("## Summary\n")
-    md_lines.append(f"- **Total resources with differences:** {total_resources}")
-    md_lines.append(f"- **Total changed scalar paths:** {total_paths}")
-    md_lines.append(f"- **Average changes per resource:** {total_paths / total_resources if total_resources > 0 else 0:.1f}")
-    
-    # Tabella aggregata: top-level keys più modificati
-    md_lines.append("\n## Aggregated top changed keys\n")
-    md_lines.append("| Key | Approx. change count |")
-    md_lines.append("|---:|---:|")
-    for k, cnt in sorted(counts_top.items(), key=lambda x: x[1], reverse=True):
-        md_lines.append(f"| {k} | {cnt} |")
+        # ========================================
+        # 6. GENERAZIONE SUMMARY MARKDOWN
+        # ========================================
+        if md_lines is not None:
+            md_lines.append("\n---\n")
+            md_lines.append("## Summary\n")
+            md_lines.append(f"- **Total resources with differences:** {total_resources}")
+            md_lines.append(f"- **Total changed scalar paths:** {total_paths}")
+            md_lines.append(f"- **Average changes per resource:** {total_paths / total_resources if total_resources > 0 else 0:.1f}")
+    
+            # Tabella aggregata: top-level keys più modificati
+            md_lines.append("\n## Aggregated top changed keys\n")
+            md_lines.append("| Key | Approx. change count |")
+            md_lines.append("|---:|---:|")
+            for k, cnt in counts_top.most_common():
+                md_lines.append(f"| {k} | {cnt} |")
 
-    # ========================================
-    # 7. SCRITTURA FILE OUTPUT
-    # ========================================
+        # ========================================
+        # 7. SCRITTURA FILE OUTPUT
+        # ========================================
     
-    # 7.2 Salva JSON Report (strutturato per integrazione)
-    json_output = {
-        "generated": datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
-        "details": details,
-        "counts_top": counts_top,
-        "total_resources": total_resources,
-        "total_paths": total_paths
-    }
-    (outdir / "diff-details.json").write_text(
-        json.dumps(json_output, indent=2, ensure_ascii=False),
-        encoding="utf-8"
-    )
+        # 7.1 Salva Markdown Report (solo con --emit-markdown)
+        if md_lines is not None:
+            (outdir / "diff-details.md").write_text("\n".join(md_lines) + "\n", encoding="utf-8")
+    
+        # 7.2 Salva JSON Report (strutturato per integrazione)
+        write_details_json(outdir / "diff-details.json", {
+            "generated": datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            "details": details,
+            "counts_top": counts_top,
+            "total_resources": total_resources,
+            "total_paths": total_paths
+        })
 
-    # 7.3 Genera HTML Report Interattivo (con CSS/JS)
-    generate_html_report(
-        outdir, summary, details, counts_top,
-        total_resources, total_paths,
-        cluster1_label, cluster2_label,
-        c1_dir, c2_dir,
-        diffs_dir
-    )
+        # 7.3 Genera HTML Report Interattivo (con CSS/JS)
+        generate_html_report(
+            outdir, summary, details, counts_top,
+            total_resources, total_paths,
+            cluster1_label, cluster2_label,
+            c1_dir, c2_dir,
+            diffs_dir,
+            c1_files, c2_files
+        )
     
-    # Print success message
-    print(f"Wrote detailed diff report: {outdir / 'diff-details.html'}")
+        # Print success message
+        print(f"Wrote detailed diff report: {outdir / 'diff-details.html'}")
+        return 0
+    finally:
+        # Libera le risorse caricate (anche da compare) per questo report
+        load_resource.cache_clear()
+        resource_identity.cache_clear()
 
 
 
@@ -641,7 +838,7 @@ def main():
 # HTML REPORT GENERATOR - Report Interattivo
 # ============================================
 
-def generate_html_report(outdir, summary, details, counts_top, total_resources, total_paths, cluster1, cluster2, c1_dir, c2_dir, diffs_dir):
+def generate_html_report(outdir, summary, details, counts_top, total_resources, total_paths, cluster1, cluster2, c1_dir, c2_dir, diffs_dir, c1_files=None, c2_files=None):
     """
     Genera report HTML interattivo con CSS/JavaScript avanzato.
     
@@ -649,7 +846,7 @@ def generate_html_report(outdir, summary, details, counts_top, total_resources,
         outdir: Directory output
         summary: Dizionario summary.json
         details: Lista dettagli risorse differenti
-        counts_top: Dizionario conteggi per top-level key
+        counts_top: Counter dei campi modificati per top-level key
         total_resources: Numero totale risorse con differenze
         total_paths: Numero totale campi modificati
         cluster1: Name primo cluster
@@ -657,6 +854,8 @@ def generate_html_report(outdir, summary, details, counts_top, total_resources,
         c1_dir: Path directory cluster1
         c2_dir: Path directory cluster2
         diffs_dir: Path directory diffs
+        c1_files: Nomi dei file in c1_dir (list_json_files), opzionale
+        c2_files: Nomi dei file in c2_dir (list_json_files), opzionale
     
     Output:
         - diff-details.html: Report HTML interattivo con:
@@ -674,6 +873,12 @@ def generate_html_report(outdir, summary, details, counts_top, total_resources,
         - Collapse/expand sezioni
     """
     
+    # Presenza dei file per set membership (senza stat per ogni risorsa)
+    if c1_files is None:
+        c1_files = list_json_files(c1_dir)
+    if c2_files is None:
+        c2_files = list_json_files(c2_dir)
+    
     # Determine comparison context (cluster vs namespace)
     # If cluster names contain "/" it's namespace comparison (e.g., "cluster/namespace")
     is_namespace_comparison = "/" in cluster1 or "/" in cluster2
@@ -715,9 +920,8 @@ def generate_html_report(outdir, summary, details, counts_top, total_resources,
         # Estrai Kind, Name e Namespace dal file JSON
         try:
             f1 = c1_dir / base
-            if f1.exists():
-                with open(f1) as file:
-                    obj = json.load(file)
+            if base in c1_files:
+                obj = load_resource(f1)
                 kind = obj.get('kind', 'Unknown')
                 name = obj.get('metadata', {}).get('name', 'unknown')
                 namespace = obj.get('metadata', {}).get('namespace', None)
@@ -740,23 +944,21 @@ def generate_html_report(outdir, summary, details, counts_top, total_resources,
             # Check if resource exists in both namespaces
             f1 = c1_dir / base
             f2 = c2_dir / base
-            if f1.exists():
+            if base in c1_files:
                 try:
-                    with open(f1) as file:
-                        obj = json.load(file)
-                        ns = obj.get('metadata', {}).get('namespace', None)
-                        if ns:
-                            resource_namespaces.append(ns)
+                    obj = load_resource(f1)
+                    ns = obj.get('metadata', {}).get('namespace', None)
+                    if ns:
+                        resource_namespaces.append(ns)
                 except (IOError, json.JSONDecodeError, ValueError):
                     # Ignore files that cannot be read or parsed
                     pass
-            if f2.exists():
+            if base in c2_files:
                 try:
-                    with open(f2) as file:
-                        obj = json.load(file)
-                        ns = obj.get('metadata', {}).get('namespace', None)
-                        if ns and ns not in resource_namespaces:
-                            resource_namespaces.append(ns)
+                    obj = load_resource(f2)
+                    ns = obj.get('metadata', {}).get('namespace', None)
+                    if ns and ns not in resource_namespaces:
+                        resource_namespaces.append(ns)
                 except (IOError, json.JSONDecodeError, ValueError):
                     # Ignore files that cannot be read or parsed
                     pass
@@ -778,149 +980,146 @@ def generate_html_report(outdir, summary, details, counts_top, total_resources,
     # ========================================
     # 2. GENERAZIONE HTML PER OGNI KIND GROUP
     # ========================================
-    kind_groups_html = []
+    # Badge e classe di riga per tipo di modifica: dipendono solo dai nomi dei
+    # cluster, preparati una volta per report invece che per ogni campo.
+    # Chiave: (valore cluster1 assente, valore cluster2 assente)
+    badge_change = ('<span class="badge badge-change" title="Value modified between clusters">🔄 Changed</span>', 'row-change')
+    badge_table = {
+        (True, False): (f'<span class="badge badge-add" title="Present in {cluster2}, not in {cluster1}">➕ Added</span>', 'row-add'),
+        (False, True): (f'<span class="badge badge-remove" title="Present in {cluster1}, not in {cluster2}">➖ Removed</span>', 'row-remove'),
+        (False, False): badge_change,
+        (True, True): badge_change,
+    }
+    # Nomi dei cluster per gli attributi data-* dei bottoni, escaped una volta
+    cluster1_attr = html_lib.escape(cluster1)
+    cluster2_attr = html_lib.escape(cluster2)
     
-    for kind in sorted(resources_by_kind.keys()):
-        resources = resources_by_kind[kind]
-        color = get_kind_color(kind)
-        total_changes = sum(len(r['changed']) for r in resources)
-        
-        # ----------------------------------------
-        # 2.1 Genera HTML per ogni risorsa del Kind
-        # ----------------------------------------
-        resources_html = []
-        
-        for resource in resources:
-            base = resource['base']
-            name = resource['name']
-            namespace = resource.get('namespace')
-            resource_namespaces = resource.get('resource_namespaces', [])
-            changed = resource['changed']
+    def iter_kind_groups():
+        """
+        Genera l'HTML dei gruppi Kind a frammenti, nell'ordine del documento.
+        
+        Apertura gruppo, intestazione risorsa, una riga alla volta, chiusure:
+        ogni frammento è scritto subito su file, senza liste di righe/risorse
+        da unire a ogni livello.
+        """
+        
+        for kind in sorted(resources_by_kind.keys()):
+            resources = resources_by_kind[kind]
+            color = get_kind_color(kind)
+            total_changes = sum(len(r['changed']) for r in resources)
             
             # ----------------------------------------
-            # 2.2 Genera righe tabella per ogni campo modificato
+            # 2.1 Apertura gruppo Kind collapsabile
             # ----------------------------------------
-            rows_html = []
+            # Ogni Kind (Deployment, ConfigMap, etc) ha sezione collassabile
+            kind_id = kind.lower().replace(' ', '-')
+            yield f'''
+            <div class="kind-group" data-kind="{kind_id}">
+                <div class="kind-header" style="border-left: 4px solid {color};">
+                    <div class="kind-title" onclick="toggleKind('{kind_id}')" style="cursor: pointer; flex: 1;">
+                        <span class="toggle-icon collapsed" id="toggle-{kind_id}">▶</span>
+                        <span class="kind-badge" style="background: {color};">{kind}</span>
+                        <span class="kind-count">{len(resources)} resource{'s' if len(resources) > 1 else ''}</span>
+                    </div>
+                    <div class="kind-stats" style="display: flex; gap: 10px; align-items: center;">
+                        <span class="stat-badge">{total_changes} total changes</span>
+                        <button onclick="event.stopPropagation(); toggleKindResources('{kind_id}')" 
+                                style="padding: 3px 6px; background: #667eea; color: white; border: none; border-radius: 3px; cursor: pointer; font-size: 0.75em; font-weight: 600; white-space: nowrap;"
+                                title="Expand/Collapse all resources in this group">
+                            +/−
+                        </button>
+                    </div>
+                </div>
+                <div class="kind-body collapsed" id="kind-body-{kind_id}">
+                    '''
             
-            for item in changed:
-                path = item['path']
-                va = item.get('a')
-                vb = item.get('b')
+            # ----------------------------------------
+            # 2.2 Sezione di ogni risorsa del Kind
+            # ----------------------------------------
+            for resource in resources:
+                base = resource['base']
+                name = resource['name']
+                namespace = resource.get('namespace')
+                resource_namespaces = resource.get('resource_namespaces', [])
+                changed = resource['changed']
                 
-                # Determina tipo modifica e badge:
-                # ➕ = Added in cluster2
-                # ➖ = Removed in cluster2
-                # 🔄 = Valore modificato
-                if va is None and vb is not None:
-                    icon = f'<span class="badge badge-add" title="Present in {cluster2}, not in {cluster1}">➕ Added</span>'
-                    row_class = 'row-add'
-                elif va is not None and vb is None:
-                    icon = f'<span class="badge badge-remove" title="Present in {cluster1}, not in {cluster2}">➖ Removed</span>'
-                    row_class = 'row-remove'
-                else:
-                    icon = '<span class="badge badge-change" title="Value modified between clusters">🔄 Changed</span>'
-                    row_class = 'row-change'
+                # ----------------------------------------
+                # 2.3 Carica contenuto diff file per modal
+                # ----------------------------------------
+                # Byte letti così come sono su disco (UTF-8 scritto da compare): niente
+                # decodifica in testo e ricodifica prima del base64
+                diff_file = diffs_dir / f"{base}.diff"
+                try:
+                    diff_content = diff_file.read_bytes()
+                except FileNotFoundError:
+                    diff_content = b"Diff file not found"
+                except OSError:
+                    diff_content = b"Error reading diff file"
+                
+                # Encode base64 per evitare problemi HTML escaping
+                diff_content_base64 = base64.b64encode(diff_content).decode('ascii')
                 
-                # Formatta valori con gestione newline e HTML escape
-                if va is not None:
-                    val_str = shortrepr(va)
-                    # Converti \n in newline reali per pre-wrap CSS
-                    val_a_html = html_lib.escape(val_str).replace('\\n', '\n')
+                # ----------------------------------------
+                # 2.3.1 Carica contenuti JSON per side-by-side diff
+                # ----------------------------------------
+                f1 = c1_dir / base
+                f2 = c2_dir / base
+                
+                json1_content = ""
+                json2_content = ""
+                
+                if base in c1_files:
+                    try:
+                        json1_content = read_pretty_json(f1)
+                    except Exception:
+                        json1_content = "Error reading file"
                 else:
-                    # Valore null: mostra ❌ con tooltip
-                    val_a_html = '<span class="null-value" title="Not set">❌</span>'
+                    json1_content = "File not found"
                 
-                if vb is not None:
-                    val_str = shortrepr(vb)
-                    val_b_html = html_lib.escape(val_str).replace('\\n', '\n')
+                if base in c2_files:
+                    try:
+                        json2_content = read_pretty_json(f2)
+                    except Exception:
+                        json2_content = "Error reading file"
                 else:
-                    val_b_html = '<span class="null-value" title="Not set">❌</span>'
+                    json2_content = "File not found"
                 
-                # Genera riga tabella HTML
-                rows_html.append(f'''
-                    <tr class="{row_class}">
-                        <td class="col-icon">{icon}</td>
-                        <td class="col-path"><code>{html_lib.escape(path)}</code></td>
-                        <td class="col-value"><code>{val_a_html}</code></td>
-                        <td class="col-value"><code>{val_b_html}</code></td>
-                    </tr>
-                ''')
-            
-            # ----------------------------------------
-            # 2.3 Carica contenuto diff file per modal
-            # ----------------------------------------
-            diff_file = diffs_dir / f"{base}.diff"
-            diff_content = ""
-            
-            if diff_file.exists():
-                try:
-                    diff_content = diff_file.read_text(encoding='utf-8')
-                except Exception:
-                    diff_content = "Error reading diff file"
-            else:
-                diff_content = "Diff file not found"
-            
-            # Encode base64 per evitare problemi HTML escaping
-            import base64
-            diff_content_base64 = base64.b64encode(diff_content.encode('utf-8')).decode('ascii')
-            
-            # ----------------------------------------
-            # 2.3.1 Carica contenuti JSON per side-by-side diff
-            # ----------------------------------------
-            f1 = c1_dir / base
-            f2 = c2_dir / base
-            
-            json1_content = ""
-            json2_content = ""
-            
-            if f1.exists():
-                try:
-                    json1_content = f1.read_text(encoding='utf-8')
-                except Exception:
-                    json1_content = "Error reading file"
-            else:
-                json1_content = "File not found"
-            
-            if f2.exists():
-                try:
-                    json2_content = f2.read_text(encoding='utf-8')
-                except Exception:
-                    json2_content = "Error reading file"
-            else:
-                json2_content = "File not found"
-            
-            # Encode to base64 for HTML embedding
-            json1_base64 = base64.b64encode(json1_content.encode('utf-8')).decode('ascii')
-            json2_base64 = base64.b64encode(json2_content.encode('utf-8')).decode('ascii')
-            
-            # ----------------------------------------
-            # 2.4 Genera HTML sezione risorsa (collapsabile)
-            # ----------------------------------------
-            # Prepara il namespace badge se disponibile con colore dinamico
-            namespace_badge = ''
-            if is_namespace_comparison and resource_namespaces:
-                # For namespace comparison, show all namespaces where resource exists
-                badges = []
-                for ns in resource_namespaces:
-                    ns_color = get_namespace_color(ns)
-                    badges.append(f'<span class="namespace-badge" style="background-color: {ns_color};">{html_lib.escape(ns)}</span>')
-                namespace_badge = ' '.join(badges)
-            elif namespace:
-                # For cluster comparison, show single namespace
-                ns_color = get_namespace_color(namespace)
-                namespace_badge = f'<span class="namespace-badge" style="background-color: {ns_color};">{html_lib.escape(namespace)}</span>'
-            
-            # Prepare namespace attribute for buttons (only for cluster comparison)
-            namespace_attr = ''
-            if not is_namespace_comparison and namespace:
-                namespace_attr = f' data-namespace="{html_lib.escape(namespace)}"'
-            
-            resources_html.append(f'''
-                <div class="resource-section" id="resource-{base.replace('.', '-')}">
+                # Encode to base64 for HTML embedding
+                json1_base64 = base64.b64encode(json1_content.encode('utf-8')).decode('ascii')
+                json2_base64 = base64.b64encode(json2_content.encode('utf-8')).decode('ascii')
+                
+                # ----------------------------------------
+                # 2.4 Genera HTML sezione risorsa (collapsabile)
+                # ----------------------------------------
+                # Prepara il namespace badge se disponibile con colore dinamico
+                namespace_badge = ''
+                if is_namespace_comparison and resource_namespaces:
+                    # For namespace comparison, show all namespaces where resource exists
+                    badges = []
+                    for ns in resource_namespaces:
+                        ns_color = get_namespace_color(ns)
+                        badges.append(f'<span class="namespace-badge" style="background-color: {ns_color};">{html_lib.escape(ns)}</span>')
+                    namespace_badge = ' '.join(badges)
+                elif namespace:
+                    # For cluster comparison, show single namespace
+                    ns_color = get_namespace_color(namespace)
+                    namespace_badge = f'<span class="namespace-badge" style="background-color: {ns_color};">{html_lib.escape(namespace)}</span>'
+                
+                # Prepare namespace attribute for buttons (only for cluster comparison)
+                namespace_attr = ''
+                if not is_namespace_comparison and namespace:
+                    namespace_attr = f' data-namespace="{html_lib.escape(namespace)}"'
+                
+                # Id HTML della risorsa (usato da sezione, toggle e corpo)
+                res_id = base.replace('.', '-')
+                filename_attr = html_lib.escape(base)
+                
+                yield f'''
+                <div class="resource-section" id="resource-{res_id}">
                     <div class="resource-header" style="border-left: 4px solid {color};">
-                        <div style="flex: 1; cursor: pointer;" onclick="toggleResource('{base.replace('.', '-')}')">
+                        <div style="flex: 1; cursor: pointer;" onclick="toggleResource('{res_id}')">
                             <div class="resource-title">
-                                <span class="toggle-icon-small" id="toggle-res-{base.replace('.', '-')}">▼</span>
+                                <span class="toggle-icon-small" id="toggle-res-{res_id}">▼</span>
                                 <span class="resource-name">{name}</span>
                                 {namespace_badge}
                             </div>
@@ -932,24 +1131,24 @@ def generate_html_report(outdir, summary, details, counts_top, total_resources,
                             </span>
                             <button class="view-diff-btn" 
                                     data-diff-content="{diff_content_base64}"
-                                    data-filename="{html_lib.escape(base)}"
-                                    data-cluster1="{html_lib.escape(cluster1)}"
-                                    data-cluster2="{html_lib.escape(cluster2)}"{namespace_attr}
+                                    data-filename="{filename_attr}"
+                                    data-cluster1="{cluster1_attr}"
+                                    data-cluster2="{cluster2_attr}"{namespace_attr}
                                     onclick="event.stopPropagation(); showDiffFromButton(this)">
                                 View Diff
                             </button>
                             <button class="view-sidebyside-btn" 
                                     data-json1="{json1_base64}"
                                     data-json2="{json2_base64}"
-                                    data-filename="{html_lib.escape(base)}"
-                                    data-cluster1="{html_lib.escape(cluster1)}"
-                                    data-cluster2="{html_lib.escape(cluster2)}"{namespace_attr}
+                                    data-filename="{filename_attr}"
+                                    data-cluster1="{cluster1_attr}"
+                                    data-cluster2="{cluster2_attr}"{namespace_attr}
                                     onclick="event.stopPropagation(); showSideBySideDiff(this)">
                                 Side-by-Side
                             </button>
                         </div>
                     </div>
-                    <div class="resource-body" id="res-body-{base.replace('.', '-')}">
+                    <div class="resource-body" id="res-body-{res_id}">
                         <table class="diff-table">
                             <thead>
                                 <tr>
@@ -960,40 +1159,38 @@ def generate_html_report(outdir, summary, details, counts_top, total_resources,
                                 </tr>
                             </thead>
                             <tbody>
-                                {''.join(rows_html)}
+                                '''
+                
+                # ----------------------------------------
+                # 2.5 Righe tabella per ogni campo modificato
+                # ----------------------------------------
+                for item in changed:
+                    path = item['path']
+                    va = item.get('a')
+                    vb = item.get('b')
+                    
+                    # Determina tipo modifica e badge:
+                    # ➕ = Added in cluster2
+                    # ➖ = Removed in cluster2
+                    # 🔄 = Valore modificato
+                    icon, row_class = badge_table[va is None, vb is None]
+                    
+                    # Genera riga tabella HTML (valori con gestione newline e HTML escape)
+                    yield DIFF_ROW_FORMAT % (row_class, icon, html_lib.escape(path), value_html(va), value_html(vb))
+                
+                # Chiusura tabella e sezione risorsa
+                yield '''
                             </tbody>
                         </table>
                     </div>
                 </div>
-            ''')
-        
-        # ----------------------------------------
-        # 2.5 Genera gruppo Kind collapsabile
-        # ----------------------------------------
-        # Ogni Kind (Deployment, ConfigMap, etc) ha sezione collassabile
-        kind_id = kind.lower().replace(' ', '-')
-        kind_groups_html.append(f'''
-            <div class="kind-group" data-kind="{kind_id}">
-                <div class="kind-header" style="border-left: 4px solid {color};">
-                    <div class="kind-title" onclick="toggleKind('{kind_id}')" style="cursor: pointer; flex: 1;">
-                        <span class="toggle-icon collapsed" id="toggle-{kind_id}">▶</span>
-                        <span class="kind-badge" style="background: {color};">{kind}</span>
-                        <span class="kind-count">{len(resources)} resource{'s' if len(resources) > 1 else ''}</span>
-                    </div>
-                    <div class="kind-stats" style="display: flex; gap: 10px; align-items: center;">
-                        <span class="stat-badge">{total_changes} total changes</span>
-                        <button onclick="event.stopPropagation(); toggleKindResources('{kind_id}')" 
-                                style="padding: 3px 6px; background: #667eea; color: white; border: none; border-radius: 3px; cursor: pointer; font-size: 0.75em; font-weight: 600; white-space: nowrap;"
-                                title="Expand/Collapse all resources in this group">
-                            +/−
-                        </button>
-                    </div>
-                </div>
-                <div class="kind-body collapsed" id="kind-body-{kind_id}">
-                    {''.join(resources_html)}
+            '''
+            
+            # Chiusura gruppo Kind
+            yield '''
                 </div>
             </div>
-        ''')
+        '''
     
     # ========================================
     # 3. GENERAZIONE TABELLA TOP CHANGED KEYS
@@ -1001,9 +1198,13 @@ def generate_html_report(outdir, summary, details, counts_top, total_resources,
     # Barra progressiva per visualizzare top-level keys più modificati
     top_keys_rows = []
     
-    for k, cnt in sorted(counts_top.items(), key=lambda x: x[1], reverse=True)[:15]:
+    # most_common è già ordinato: il primo conteggio è il massimo
+    top_keys = counts_top.most_common(15)
+    top_max = top_keys[0][1] if top_keys else 1
+    
+    for k, cnt in top_keys:
         # Calcola larghezza barra proporzionale al max
-        bar_width = int((cnt / max(counts_top.values())) * 100) if counts_top else 0
+        bar_width = int((cnt / top_max) * 100)
         
         top_keys_rows.append(f'''
             <tr>
@@ -1056,7 +1257,7 @@ def generate_html_report(outdir, summary, details, counts_top, total_resources,
     
     # Template HTML con CSS embedded e JavaScript per interattività
     
-    html_content = f'''<!DOCTYPE html>
+    html_head = f'''<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
@@ -3839,7 +4040,7 @@ def generate_html_report(outdir, summary, details, counts_top, total_resources,
         
         <div id="missingResourcesSection" class="missing-resources-section">
             <h3 style="margin-bottom: 20px; color: #111827; font-size: 1.5em;">Resources Present in Only One {comparison_type_capitalized}</h3>
-            {generate_missing_resources_table(summary, cluster1, cluster2, c1_dir, c2_dir)}
+            {generate_missing_resources_table(summary, cluster1, cluster2, c1_dir, c2_dir, c1_files, c2_files)}
         </div>
         
         <div class="content">
@@ -3859,7 +4060,8 @@ def generate_html_report(outdir, summary, details, counts_top, total_resources,
                         +/− All
                     </button>
                 </div>
-                {''.join(kind_groups_html)}
+                '''
+    html_tail = f'''
             </div>
         </div>
         
@@ -4005,8 +4207,16 @@ def generate_html_report(outdir, summary, details, counts_top, total_resources,
 </body>
 </html>'''
     
-    (outdir / "diff-details.html").write_text(html_content, encoding="utf-8")
+    # Scrittura in streaming: in memoria c'è un solo frammento alla volta
+    # (i contenuti JSON/diff in base64 di ogni risorsa sono la parte più pesante).
+    # Buffer da 1 MiB: i frammenti (una riga di tabella) sono piccoli, così le
+    # scritture su disco restano poche
+    with open(outdir / "diff-details.html", "w", encoding="utf-8", buffering=1 << 20) as fh:
+        fh.write(html_head)
+        for fragment in iter_kind_groups():
+            fh.write(fragment)
+        fh.write(html_tail)
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -27,6 +27,12 @@ import json
 from pathlib import Path
 import sys
 
+# Parser JSON opzionale (estensione C, molto più veloce della stdlib)
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on environment
+    orjson = None
+
 # ============================================
 # ANSI COLOR CODES - Colori per Console
 # ============================================
@@ -53,16 +59,14 @@ def read_summary(p: Path):
         p: Path al file summary.json
     
     Returns:
-        Dizionario JSON parsed
-    
-    Exit:
-        Codice 2 se file non leggibile
+        Dizionario JSON parsed, o None se il file non è leggibile
     """
     try:
-        return json.loads(p.read_text(encoding='utf-8'))
+        data = p.read_bytes()
+        return orjson.loads(data) if orjson is not None else json.loads(data)
     except Exception as e:
         print(f"Failed to read summary JSON: {e}", file=sys.stderr)
-        sys.exit(2)
+        return None
 
 
 def top_kinds_by_total(by_kind, top):
@@ -106,7 +110,7 @@ def print_subsection(title):
 # MAIN - Generazione Report Console
 # ============================================
 
-def main():
+def main(argv=None):
     """
     Genera report console colorato da summary.json e directory diffs.
     
@@ -122,6 +126,12 @@ def main():
         --top: Numero max risorse da showsre (default: 10)
         --cluster1: Nome primo cluster (default: "cluster1")
         --cluster2: Nome secondo cluster (default: "cluster2")
+    
+    Args:
+        argv: Argomenti CLI (default: sys.argv[1:])
+    
+    Returns:
+        Exit code: 0 report generato, 2 summary non leggibile
     """
     # ========================================
     # 1. PARSING ARGOMENTI
@@ -132,7 +142,7 @@ def main():
     p.add_argument('--top', type=int, default=10)
     p.add_argument('--cluster1', default='cluster1')
     p.add_argument('--cluster2', default='cluster2')
-    args = p.parse_args()
+    args = p.parse_args(argv)
 
     summary_path = Path(args.summary)
     diffs_dir = Path(args.diffs)
@@ -140,12 +150,14 @@ def main():
     # Validazione file
     if not summary_path.exists():
         print(f"Summary file not found: {summary_path}", file=sys.stderr)
-        sys.exit(2)
+        return 2
 
     # ========================================
     # 2. CARICAMENTO DATI
     # ========================================
     summary = read_summary(summary_path)
+    if summary is None:
+        return 2
     counts = summary.get('counts', {})
     missing2 = counts.get('missing_in_2', 0)
     missing1 = counts.get('missing_in_1', 0)
@@ -172,7 +184,7 @@ def main():
     if total_changes == 0:
         print(f"{GREEN}[OK] Clusters are IDENTICAL for the compared resources!{RESET}\n")
         print(f"{DIM}No differences detected between the two clusters.{RESET}")
-        return
+        return 0
     
     print(f"{BOLD}Total Changes Detected:{RESET} {YELLOW}{total_changes}{RESET}\n")
     
@@ -293,7 +305,8 @@ def main():
     print(f"Diff Files:           {CYAN}{diffs_dir}{RESET}")
     
     print(f"\n{DIM}{'=' * 80}{RESET}\n")
+    return 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -9,14 +9,22 @@ from pathlib import Path
 import json
 import subprocess
 import sys
+import shutil
 import os
+import io
+import threading
+from contextlib import redirect_stdout, redirect_stderr
+from unittest.mock import patch
 
-# Add lib to path
+# Add lib and the repository root to path
 ROOT = Path(__file__).parent.parent
 sys.path.insert(0, str(ROOT / 'lib'))
+sys.path.insert(0, str(ROOT))
 
 from normalize import normalize
-from compare import generate_configmap_diff
+from compare import generate_configmap_diff, read_json_text
+from lib import compare as lib_compare, diff_details, report as lib_report
+import kdiff_cli
 
 
 class TestNormalize(unittest.TestCase):
@@ -283,6 +291,179 @@ class TestCompare(unittest.TestCase):
             # Diff file should be created
             diff_files = list(diffs_dir.glob('*.diff'))
             self.assertEqual(len(diff_files), 1)
+    
+    def test_compare_parallel_jobs_match_serial(self):
+        """--jobs spreads the file diffs over processes with the same results"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            (tmpdir / 'c1').mkdir()
+            (tmpdir / 'c2').mkdir()
+            for i in range(70):
+                res = {"kind": "Deployment", "metadata": {"name": f"app{i}"}, "spec": {"replicas": 1}}
+                (tmpdir / 'c1' / f'deployment__ns__app{i:02d}.json').write_text(json.dumps(res))
+                res['spec']['replicas'] = 1 + i % 2
+                (tmpdir / 'c2' / f'deployment__ns__app{i:02d}.json').write_text(json.dumps(res))
+            
+            outputs = {}
+            for jobs in ('1', '2'):
+                out = tmpdir / f'jobs{jobs}'
+                result = subprocess.run(
+                    [sys.executable, str(ROOT / 'lib' / 'compare.py'),
+                     str(tmpdir / 'c1'), str(tmpdir / 'c2'), str(out / 'diffs'),
+                     '--json-out', str(out / 'summary.json'), '--jobs', jobs],
+                    capture_output=True
+                )
+                self.assertEqual(result.returncode, 1)
+                diffs = {p.name: p.read_text() for p in (out / 'diffs').glob('*.diff')}
+                outputs[jobs] = (json.loads((out / 'summary.json').read_text()), diffs)
+            
+            self.assertEqual(outputs['1'], outputs['2'])
+            self.assertEqual(len(outputs['2'][0]['different']), 35)
+    
+    def test_compare_uses_hash_index(self):
+        """Files with the same hash in both indexes are not parsed or diffed"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            dir1 = Path(tmpdir) / 'cluster1'
+            dir2 = Path(tmpdir) / 'cluster2'
+            diffs_dir = Path(tmpdir) / 'diffs'
+            
+            dir1.mkdir()
+            dir2.mkdir()
+            
+            # Contents differ, but the indexes claim they are identical:
+            # only the index is trusted for this file
+            (dir1 / 'configmap__ns__same.json').write_text(json.dumps({"data": {"k": "1"}}))
+            (dir2 / 'configmap__ns__same.json').write_text(json.dumps({"data": {"k": "2"}}))
+            (dir1 / 'configmap__ns__other.json').write_text(json.dumps({"data": {"k": "1"}}))
+            (dir2 / 'configmap__ns__other.json').write_text(json.dumps({"data": {"k": "2"}}))
+            (dir1 / 'index.tsv').write_text("configmap__ns__same.json\tabc\nconfigmap__ns__other.json\t111\n")
+            (dir2 / 'index.tsv').write_text("configmap__ns__same.json\tabc\nconfigmap__ns__other.json\t222\n")
+            
+            result = subprocess.run(
+                [sys.executable, str(ROOT / 'lib' / 'compare.py'),
+                 str(dir1), str(dir2), str(diffs_dir),
+                 '--json-out', str(Path(tmpdir) / 'summary.json')],
+                capture_output=True
+            )
+            
+            self.assertEqual(result.returncode, 1)
+            summary = json.loads((Path(tmpdir) / 'summary.json').read_text())
+            self.assertEqual(summary['different'], ['configmap__ns__other.json'])
+    
+    def test_compare_and_details_parse_each_file_once(self):
+        """In-process compare + diff_details share parsed resources"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            outdir = Path(tmpdir)
+            for cluster, replicas in (('c1', 1), ('c2', 2)):
+                (outdir / cluster).mkdir()
+                (outdir / cluster / 'deployment__ns__web.json').write_text(json.dumps(
+                    {"kind": "Deployment", "metadata": {"name": "web", "namespace": "ns"}, "spec": {"replicas": replicas}}))
+            (outdir / 'c1' / 'configmap__ns__only1.json').write_text(json.dumps(
+                {"kind": "ConfigMap", "metadata": {"name": "only1", "namespace": "ns"}}))
+            
+            with patch.object(lib_compare, 'load_json', wraps=lib_compare.load_json) as mock_load, \
+                    patch.object(diff_details, 'load_json', wraps=diff_details.load_json) as mock_details_load, \
+                    redirect_stdout(io.StringIO()):
+                rc = lib_compare.main([str(outdir / 'c1'), str(outdir / 'c2'), str(outdir / 'diffs'),
+                                       '--json-out', str(outdir / 'summary.json')], keep_resources=True)
+                self.assertEqual(rc, 1)
+                self.assertEqual(diff_details.main([str(outdir), '--cluster1', 'c1', '--cluster2', 'c2']), 0)
+            
+            # Two sides of the differing file, each parsed once and shared
+            self.assertEqual(mock_load.call_count, 2)
+            # The cache is released by diff_details, and by a standalone compare
+            self.assertEqual(lib_compare.load_resource.cache_info().currsize, 0)
+            with redirect_stdout(io.StringIO()):
+                lib_compare.main([str(outdir / 'c1'), str(outdir / 'c2'), str(outdir / 'diffs')])
+            self.assertEqual(lib_compare.load_resource.cache_info().currsize, 0)
+            # summary.json + the missing file (only its kind/name/namespace are kept)
+            self.assertEqual(mock_details_load.call_count, 2)
+            self.assertTrue((outdir / 'diff-details.html').exists())
+            # The Markdown report is opt-in
+            self.assertFalse((outdir / 'diff-details.md').exists())
+            with redirect_stdout(io.StringIO()):
+                self.assertEqual(diff_details.main([str(outdir), '--cluster1', 'c1', '--cluster2', 'c2',
+                                                    '--emit-markdown']), 0)
+            self.assertIn('`spec.replicas`', (outdir / 'diff-details.md').read_text())
+    
+    def test_compare_skips_byte_identical_files(self):
+        """Byte-identical files are not parsed, even without a hash index"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            for cluster in ('c1', 'c2'):
+                (tmpdir / cluster).mkdir()
+                (tmpdir / cluster / 'deployment__ns__web.json').write_text('{"spec": {"replicas": 1}}')
+            
+            with patch.object(lib_compare, 'load_json', wraps=lib_compare.load_json) as mock_load, \
+                    redirect_stdout(io.StringIO()):
+                rc = lib_compare.main([str(tmpdir / 'c1'), str(tmpdir / 'c2'), str(tmpdir / 'diffs')])
+            
+            self.assertEqual(rc, 0)
+            mock_load.assert_not_called()
+    
+    def test_read_json_text_canonical_format(self):
+        """Compact and indented files are formatted like json.dumps(sort_keys, indent=2)"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            obj = {"spec": {"b": [1, 2.5, None], "a": {}}, "data": {"k": "välue"}, "list": []}
+            path = Path(tmpdir) / 'res.json'
+            path.write_text(json.dumps(obj, separators=(',', ':')), encoding='utf-8')
+            
+            expected = json.dumps(obj, sort_keys=True, indent=2, ensure_ascii=False).splitlines(keepends=True)
+            self.assertEqual(read_json_text(path), expected)
+
+    def test_compare_canonical_matches_reformatted(self):
+        """--canonical on indented files gives the same diffs as re-formatting them"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            resources = {
+                'configmap__ns__cfg.json': ({"data": {"k": "v1"}}, {"data": {"k": "v2", "n": "x"}}),
+                'deployment__ns__web.json': ({"spec": {"replicas": 1}}, {"spec": {"replicas": 3}}),
+            }
+            for cluster, idx in (('c1', 0), ('c2', 1)):
+                (tmpdir / cluster).mkdir()
+                for name, pair in resources.items():
+                    text = json.dumps(pair[idx], sort_keys=True, indent=2, ensure_ascii=False) + "\n"
+                    (tmpdir / cluster / name).write_text(text, encoding='utf-8')
+
+            outputs = {}
+            for mode, extra in (('plain', []), ('canonical', ['--canonical'])):
+                diffs = tmpdir / f'diffs-{mode}'
+                with redirect_stdout(io.StringIO()):
+                    rc = lib_compare.main([str(tmpdir / 'c1'), str(tmpdir / 'c2'), str(diffs)] + extra)
+                self.assertEqual(rc, 1)
+                outputs[mode] = {p.name: p.read_text() for p in diffs.iterdir()}
+
+            self.assertEqual(outputs['canonical'], outputs['plain'])
+            self.assertEqual(len(outputs['plain']), 2)
+
+    @unittest.skipUnless(shutil.which('diff'), "diff command not available")
+    def test_compare_large_files_use_system_diff(self):
+        """Large files are diffed with the system diff, with the same changed lines as difflib"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            env1 = [{"name": f"VAR_{i}", "value": str(i)} for i in range(400)]
+            env2 = [dict(e, value="changed") if i == 200 else e for i, e in enumerate(env1)]
+            for cluster, env in (('c1', env1), ('c2', env2)):
+                (tmpdir / cluster).mkdir()
+                (tmpdir / cluster / 'deployment__ns__web.json').write_text(json.dumps({"spec": {"env": env}}))
+
+            outputs = {}
+            for mode, command in (('system', lib_compare.DIFF_COMMAND), ('difflib', None)):
+                diffs = tmpdir / f'diffs-{mode}'
+                with patch.object(lib_compare, 'DIFF_COMMAND', command), \
+                        patch.object(lib_compare, 'subprocess', wraps=lib_compare.subprocess) as mock_subprocess, \
+                        redirect_stdout(io.StringIO()):
+                    rc = lib_compare.main([str(tmpdir / 'c1'), str(tmpdir / 'c2'), str(diffs)])
+                self.assertEqual(rc, 1)
+                self.assertEqual(mock_subprocess.run.called, command is not None)
+                outputs[mode] = (diffs / 'deployment__ns__web.json.diff').read_text().splitlines()
+
+            for lines in outputs.values():
+                self.assertEqual(lines[0], f"--- {tmpdir / 'c1' / 'deployment__ns__web.json'}")
+                self.assertIn('-        "value": "200"', lines)
+                self.assertIn('+        "value": "changed"', lines)
+            changed = lambda lines: [l for l in lines[2:] if l[:1] in '+-']
+            self.assertEqual(changed(outputs['system']), changed(outputs['difflib']))
 
 
 class TestEndToEnd(unittest.TestCase):
@@ -408,6 +589,7 @@ fi
             env['PATH'] = f"{bin_dir}:{env['PATH']}"
             env['RESP_DIR'] = str(resp_dir)
             env['KDIFF_NO_BROWSER'] = '1'  # Prevent browser opening during tests
+            env['KUBECONFIG'] = str(tmpdir / 'no-kubeconfig')  # Contexts come from the mock kubectl
             
             result = subprocess.run(
                 [str(ROOT / 'bin' / 'kdiff'),
@@ -521,6 +703,124 @@ class TestReports(unittest.TestCase):
             
             # Other files might not be created depending on summary structure
             # so we only check for HTML which should always be present
+
+    def test_diff_details_parallel_jobs_match_serial(self):
+        """--jobs compares the differing resources in processes with the same report"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            (tmpdir / 'c1').mkdir()
+            (tmpdir / 'c2').mkdir()
+            different = []
+            for i in range(70):
+                name = f'deployment__ns__app{i:02d}.json'
+                res = {"kind": "Deployment", "metadata": {"name": f"app{i}"}, "spec": {"replicas": 1}}
+                (tmpdir / 'c1' / name).write_text(json.dumps(res))
+                res['spec'] = {"replicas": 2, "paused": True} if i % 2 else {"replicas": 3}
+                (tmpdir / 'c2' / name).write_text(json.dumps(res))
+                different.append(name)
+            different.append('deployment__ns__gone.json')
+            summary = {"missing_in_1": [], "missing_in_2": [], "different": different,
+                       "counts": {"missing_in_1": 0, "missing_in_2": 0, "different": len(different)}}
+            (tmpdir / 'summary.json').write_text(json.dumps(summary))
+
+            outputs = {}
+            for jobs in ('1', '2'):
+                result = subprocess.run(
+                    [sys.executable, str(ROOT / 'lib' / 'diff_details.py'), str(tmpdir),
+                     '--cluster1', 'c1', '--cluster2', 'c2', '--jobs', jobs],
+                    capture_output=True
+                )
+                self.assertEqual(result.returncode, 0)
+                report = json.loads((tmpdir / 'diff-details.json').read_text())
+                report.pop('generated')
+                outputs[jobs] = report
+
+            self.assertEqual(outputs['1'], outputs['2'])
+            self.assertEqual(outputs['2']['total_resources'], 71)
+            self.assertEqual(outputs['2']['total_paths'], 105)
+            self.assertEqual(outputs['2']['details'][-1], {"file": "deployment__ns__gone.json", "changed": []})
+
+    def test_missing_resources_table_escapes_values(self):
+        """Names and namespaces of resources only in one cluster are HTML-escaped"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            (tmpdir / 'c1').mkdir()
+            (tmpdir / 'c2').mkdir()
+            res = {"kind": "ConfigMap", "metadata": {"name": "<script>x</script>", "namespace": "a&b"}}
+            (tmpdir / 'c1' / 'configmap__a&b__x.json').write_text(json.dumps(res))
+            summary = {"missing_in_2": ['configmap__a&b__x.json'], "missing_in_1": []}
+
+            table = diff_details.generate_missing_resources_table(summary, 'c1', 'c2', tmpdir / 'c1', tmpdir / 'c2')
+            self.assertIn('<strong>&lt;script&gt;x&lt;/script&gt;</strong>', table)
+            self.assertIn('<td>a&amp;b</td>', table)
+            self.assertNotIn('<script>', table)
+            self.assertTrue(table.strip().startswith('<table class="missing-table">'))
+            self.assertTrue(table.strip().endswith('</table>'))
+
+    def test_resource_identity_streams_large_files(self):
+        """Large resource files give the same kind/name/namespace read with ijson"""
+        if diff_details.ijson is None:
+            self.skipTest("ijson not installed")
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            docs = {
+                'crd.json': {"apiVersion": "v1", "kind": "CustomResourceDefinition",
+                             "metadata": {"labels": {"name": "x"}, "name": "big"},
+                             "spec": {"schema": "x" * 300000}},
+                'cm.json': {"data": {"kind": "not this"}, "kind": "ConfigMap",
+                            "metadata": {"name": "cfg", "namespace": "ns"}},
+                'list.json': [{"kind": "Pod"}],
+            }
+            for name, doc in docs.items():
+                (tmpdir / name).write_text(json.dumps(doc, sort_keys=True))
+            (tmpdir / 'broken.json').write_text('{"kind": "Pod", "metadata": {"name": ')
+
+            expected = {'crd.json': ('CustomResourceDefinition', 'big', '-'),
+                        'cm.json': ('ConfigMap', 'cfg', 'ns'), 'list.json': None, 'broken.json': None}
+            for threshold in (diff_details.IDENTITY_STREAM_MIN_BYTES, 0):
+                with patch.object(diff_details, 'IDENTITY_STREAM_MIN_BYTES', threshold):
+                    diff_details.resource_identity.cache_clear()
+                    for name, identity in expected.items():
+                        self.assertEqual(diff_details.resource_identity(tmpdir / name), identity)
+            diff_details.resource_identity.cache_clear()
+
+    def test_details_json_streamed_like_json_dumps(self):
+        """diff-details.json written item by item has the json.dumps(indent=2) layout"""
+        report = {
+            "generated": "2024-01-15T12:00:00Z",
+            "details": [
+                {"file": "configmap__ns__a.json", "changed": [{"path": "data.k", "a": "x\ny", "b": None}]},
+                {"file": "deployment__ns__b.json", "changed": [{"path": "spec.x", "a": {}, "b": [1, "é"]}]},
+                {"file": "secret__ns__c.json", "changed": []},
+            ],
+            "counts_top": {"data": 1, "spec": 1},
+            "total_resources": 3,
+            "total_paths": 2,
+        }
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / 'diff-details.json'
+            for details in (report["details"], []):
+                diff_details.write_details_json(path, dict(report, details=details))
+                expected = json.dumps(dict(report, details=details), indent=2, ensure_ascii=False)
+                self.assertEqual(path.read_text(encoding='utf-8'), expected)
+
+    def test_console_report_main_return_codes(self):
+        """report.main runs in-process and returns an exit code instead of exiting"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            summary = {"missing_in_1": [], "missing_in_2": [], "different": [],
+                       "counts": {"missing_in_1": 0, "missing_in_2": 0, "different": 0}}
+            (tmpdir / 'summary.json').write_text(json.dumps(summary))
+            (tmpdir / 'diffs').mkdir()
+            (tmpdir / 'broken.json').write_text('{not json')
+            
+            out = io.StringIO()
+            with redirect_stdout(out), redirect_stderr(io.StringIO()):
+                self.assertEqual(lib_report.main([str(tmpdir / 'summary.json'), str(tmpdir / 'diffs')]), 0)
+                self.assertEqual(lib_report.main([str(tmpdir / 'missing.json'), str(tmpdir / 'diffs')]), 2)
+                self.assertEqual(lib_report.main([str(tmpdir / 'broken.json'), str(tmpdir / 'diffs')]), 2)
+            self.assertIn('IDENTICAL', out.getvalue())
     
     def test_color_scheme_toggle_in_html(self):
         """Test that color scheme toggle is present in generated HTML"""
@@ -743,6 +1043,83 @@ class TestTwoClusterMode(unittest.TestCase):
             self.assertNotEqual(files_c1[0].name, files_c2[0].name)
 
 
+class TestOutputCleanup(unittest.TestCase):
+    """Test removal of the previous run's output directory"""
+    
+    def test_old_output_removed_in_background(self):
+        """The old tree is moved aside at once and deleted before the process exits"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            outdir = Path(tmpdir) / 'latest'
+            (outdir / 'c1').mkdir(parents=True)
+            for i in range(50):
+                (outdir / 'c1' / f'configmap__ns__{i}.json').write_text('{}')
+            
+            with redirect_stdout(io.StringIO()):
+                kdiff_cli.cleanup_output_dir(outdir)
+            self.assertFalse(outdir.exists())
+            
+            for thread in threading.enumerate():
+                if thread.name == 'kdiff-cleanup':
+                    self.assertFalse(thread.daemon)
+                    thread.join()
+            self.assertEqual(list(Path(tmpdir).iterdir()), [])
+
+
+class TestKubeconfigContexts(unittest.TestCase):
+    """Test reading context names directly from kubeconfig files"""
+    
+    def setUp(self):
+        if kdiff_cli.yaml is None:
+            self.skipTest("PyYAML not installed")
+    
+    def test_contexts_merged_from_kubeconfig_list(self):
+        """Contexts of all KUBECONFIG files are returned in order, without duplicates"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cfg1 = Path(tmpdir) / 'config1'
+            cfg2 = Path(tmpdir) / 'config2'
+            cfg1.write_text("contexts:\n- name: prod\n  context: {cluster: p}\n- name: staging\n")
+            cfg2.write_text("contexts:\n- name: staging\n- name: dev\n")
+            kubeconfig = os.pathsep.join([str(cfg1), str(Path(tmpdir) / 'missing'), str(cfg2)])
+            with patch.dict(os.environ, {'KUBECONFIG': kubeconfig}):
+                self.assertEqual(kdiff_cli.read_kubeconfig_contexts(), ['prod', 'staging', 'dev'])
+    
+    def test_falls_back_when_kubeconfig_unreadable(self):
+        """None (use kubectl) when no kubeconfig exists or it cannot be parsed"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with patch.dict(os.environ, {'KUBECONFIG': str(Path(tmpdir) / 'missing')}):
+                self.assertIsNone(kdiff_cli.read_kubeconfig_contexts())
+            broken = Path(tmpdir) / 'broken'
+            broken.write_text("contexts: [unclosed\n")
+            with patch.dict(os.environ, {'KUBECONFIG': str(broken)}):
+                self.assertIsNone(kdiff_cli.read_kubeconfig_contexts())
+
+
+class TestResourceDiscovery(unittest.TestCase):
+    """Test filtering of resource types through kubectl api-resources"""
+    
+    def test_available_kinds_parses_api_resources(self):
+        """Kinds, plural names and short names are all recognized"""
+        output = (
+            "NAME                      SHORTNAMES   APIVERSION   NAMESPACED   KIND\n"
+            "configmaps                cm           v1           true         ConfigMap\n"
+            "secrets                                v1           true         Secret\n"
+            "deployments               deploy       apps/v1      true         Deployment\n"
+        )
+        with patch('kdiff_cli.subprocess.run') as mock_run:
+            mock_run.return_value = subprocess.CompletedProcess([], 0, stdout=output, stderr='')
+            kinds = kdiff_cli.available_kinds('ctx')
+        self.assertIn('configmap', kinds)
+        self.assertIn('secrets', kinds)
+        self.assertIn('deploy', kinds)
+        self.assertNotIn('horizontalpodautoscaler', kinds)
+    
+    def test_available_kinds_unexpected_output(self):
+        """Unrecognized output disables filtering instead of dropping every type"""
+        with patch('kdiff_cli.subprocess.run') as mock_run:
+            mock_run.return_value = subprocess.CompletedProcess([], 0, stdout='{}\n', stderr='')
+            self.assertIsNone(kdiff_cli.available_kinds('ctx'))
+
+
 class TestArgumentValidation(unittest.TestCase):
     """Test CLI argument validation"""
     
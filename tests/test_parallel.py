@@ -5,6 +5,7 @@ Tests multi-threading, worker management, and thread safety.
 """
 
 import unittest
+import io
 import json
 import sys
 import tempfile
@@ -17,6 +18,7 @@ import time
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
+import kdiff_cli
 from kdiff_cli import fetch_resources, fetch_single_resource
 
 
@@ -62,6 +64,53 @@ class TestParallelExecution(unittest.TestCase):
         # Should have called kubectl for each resource type
         self.assertEqual(mock_run.call_count, 3)
         
+    @patch('kdiff_cli.subprocess.run')
+    @patch('kdiff_cli.load_normalize_func')
+    def test_every_namespace_fetched_once_per_kind(self, mock_normalize, mock_run):
+        """Test that each (kind, namespace) pair gets exactly one kubectl call."""
+        def mock_kubectl(cmd, *args, **kwargs):
+            ns = cmd[cmd.index('-n') + 1]
+            kind = cmd[cmd.index('get') + 1]
+            result = MagicMock()
+            result.returncode = 0
+            result.stderr = ""
+            result.stdout = json.dumps({
+                'items': [{'metadata': {'name': f'{kind}-res', 'namespace': ns}}]
+            })
+            return result
+
+        mock_run.side_effect = mock_kubectl
+        mock_normalize.return_value = lambda x, keep_metadata=False: x
+
+        # Repeated names are fetched once
+        success = fetch_resources('test-context', self.test_dir, ['deployment', 'configmap', 'deployment'],
+                                  ['ns1', 'ns2', 'ns3', 'ns1'])
+
+        self.assertTrue(success)
+        calls = sorted((c[0][0][c[0][0].index('get') + 1], c[0][0][c[0][0].index('-n') + 1])
+                       for c in mock_run.call_args_list)
+        self.assertEqual(calls, sorted((k, ns) for k in ['deployment', 'configmap']
+                                       for ns in ['ns1', 'ns2', 'ns3']))
+        self.assertEqual(len(list(self.test_dir.glob('*.json'))), 6)
+
+    @patch('kdiff_cli.subprocess.run')
+    @patch('kdiff_cli.load_normalize_func')
+    def test_heaviest_kinds_fetched_first(self, mock_normalize, mock_run):
+        """Test that fetches are started in decreasing KIND_WEIGHT order."""
+        result = MagicMock()
+        result.returncode = 0
+        result.stderr = ""
+        result.stdout = json.dumps({'items': []})
+        mock_run.return_value = result
+        mock_normalize.return_value = lambda x, keep_metadata=False: x
+
+        success = fetch_resources('test-context', self.test_dir, ['role', 'deployment', 'secret', 'configmap'],
+                                  'default', max_workers=1)
+
+        self.assertTrue(success)
+        order = [c[0][0][c[0][0].index('get') + 1] for c in mock_run.call_args_list]
+        self.assertEqual(order, ['secret', 'configmap', 'deployment', 'role'])
+
     @patch('kdiff_cli.subprocess.run')
     @patch('kdiff_cli.load_normalize_func')
     def test_max_workers_parameter_is_used(self, mock_normalize, mock_run):
@@ -295,6 +344,364 @@ class TestFetchSingleResource(unittest.TestCase):
         self.assertIsNotNone(error_msg)
         self.assertIn("does not exist", error_msg)
 
+    @patch('kdiff_cli.subprocess.run')
+    def test_fetch_single_resource_file_layout(self, mock_run):
+        """Test that written files are canonical JSON: compact by default, indented on request."""
+        item = {'metadata': {'name': 'cfg', 'namespace': 'default'},
+                'data': {'z': 'è', 'a': '1'}, 'spec': {'replicas': 3, 'paused': False}}
+        mock_run.return_value = MagicMock(
+            returncode=0,
+            stderr=b"",
+            stdout=json.dumps({'items': [item]}).encode('utf-8')
+        )
+
+        mock_norm = lambda x, keep_metadata=False: x
+        path = self.test_dir / 'configmap__default__cfg.json'
+
+        fetch_single_resource(
+            'test-context', 'configmap', 'default', self.test_dir,
+            mock_norm, False, False, self.print_lock
+        )
+        self.assertEqual(path.read_text(encoding='utf-8'),
+                         json.dumps(item, sort_keys=True, separators=(',', ':'), ensure_ascii=False) + "\n")
+
+        fetch_single_resource(
+            'test-context', 'configmap', 'default', self.test_dir,
+            mock_norm, False, False, self.print_lock, pretty=True
+        )
+        self.assertEqual(path.read_text(encoding='utf-8'),
+                         json.dumps(item, sort_keys=True, indent=2, ensure_ascii=False) + "\n")
+
+
+    def test_fetch_single_resource_streams_cluster_wide_lists(self):
+        """Test that cluster-wide lists are parsed from the kubectl pipe, errors included."""
+        if kdiff_cli.ijson is None:
+            self.skipTest("ijson not installed")
+        items = [{'metadata': {'name': f'cfg{i}', 'namespace': f'ns{i}'}, 'data': {'ratio': 0.5}} for i in range(3)]
+        script = f"import sys; sys.stdout.write({json.dumps(json.dumps({'kind': 'List', 'items': items}))})"
+        mock_norm = lambda x, keep_metadata=False: x
+
+        with patch('kdiff_cli.kubectl_get_cmd', return_value=[sys.executable, '-c', script]):
+            success, count, has_errors, error_msg = fetch_single_resource(
+                'test-context', 'configmap', None, self.test_dir,
+                mock_norm, False, False, self.print_lock
+            )
+        self.assertTrue(success)
+        self.assertEqual(count, 3)
+        written = json.loads((self.test_dir / 'configmap__ns1__cfg1.json').read_text(encoding='utf-8'))
+        self.assertEqual(written, items[1])
+
+        failing = "import sys; sys.stderr.write('Error from server (Forbidden): configmaps is forbidden'); sys.exit(1)"
+        with patch('kdiff_cli.kubectl_get_cmd', return_value=[sys.executable, '-c', failing]), patch('sys.stderr'):
+            success, count, has_errors, error_msg = fetch_single_resource(
+                'test-context', 'configmap', None, self.test_dir,
+                mock_norm, False, False, self.print_lock
+            )
+        self.assertTrue(success)
+        self.assertEqual(count, 0)
+        self.assertTrue(has_errors)
+        self.assertIsNone(error_msg)
+
+    @patch('kdiff_cli.STREAM_PARSE_THRESHOLD', 0)
+    @patch('kdiff_cli.subprocess.run')
+    def test_fetch_single_resource_streaming_parse(self, mock_run):
+        """Test that streamed parsing (ijson) writes the same files as a full parse."""
+        if kdiff_cli.ijson is None:
+            self.skipTest("ijson not installed")
+        items = [{'metadata': {'name': f'cfg{i}', 'namespace': 'default'},
+                  'data': {'ratio': 0.5, 'count': i}} for i in range(3)]
+        mock_run.return_value = MagicMock(
+            returncode=0,
+            stderr=b"",
+            stdout=json.dumps({'kind': 'List', 'items': items}).encode('utf-8')
+        )
+
+        mock_norm = lambda x, keep_metadata=False: x
+
+        success, count, has_errors, error_msg = fetch_single_resource(
+            'test-context', 'configmap', 'default', self.test_dir,
+            mock_norm, False, False, self.print_lock
+        )
+
+        self.assertTrue(success)
+        self.assertEqual(count, 3)
+        for item in items:
+            path = self.test_dir / f"configmap__default__{item['metadata']['name']}.json"
+            self.assertEqual(json.loads(path.read_text(encoding='utf-8')), item)
+
+
+class TestApiProxyFetch(unittest.TestCase):
+    """Test fetching resources through a kubectl proxy."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.print_lock = Lock()
+
+    def tearDown(self):
+        """Clean up test fixtures."""
+        if self.test_dir.exists():
+            shutil.rmtree(self.test_dir)
+
+    def test_api_fetch_adds_type_information(self):
+        """Test that REST list items get the kind/apiVersion that kubectl would add."""
+        proxy = MagicMock()
+        proxy.resource_info.side_effect = lambda kind: (*kdiff_cli.RESOURCE_API[kind], True)
+        proxy.get.return_value = (200, json.dumps({
+            'kind': 'DeploymentList',
+            'items': [{'metadata': {'name': 'web', 'namespace': 'default'}}]
+        }).encode('utf-8'))
+
+        success, count, has_errors, error_msg = kdiff_cli.fetch_single_resource_api(
+            proxy, 'test-context', 'deployment', 'default', self.test_dir,
+            lambda x, keep_metadata=False: x, False, False, self.print_lock
+        )
+
+        self.assertTrue(success)
+        self.assertEqual(count, 1)
+        proxy.get.assert_called_once_with('/apis/apps/v1/namespaces/default/deployments?limit=500', stream=kdiff_cli.ijson is not None)
+        written = json.loads((self.test_dir / 'deployment__default__web.json').read_text(encoding='utf-8'))
+        self.assertEqual(written['kind'], 'Deployment')
+        self.assertEqual(written['apiVersion'], 'apps/v1')
+
+    def test_api_fetch_follows_continue_token(self):
+        """Test that paginated lists are read page by page until no continue token is left."""
+        proxy = MagicMock()
+        proxy.resource_info.side_effect = lambda kind: (*kdiff_cli.RESOURCE_API[kind], True)
+        proxy.get.side_effect = [
+            (200, json.dumps({'metadata': {'continue': 'tok/1'},
+                              'items': [{'metadata': {'name': 'a', 'namespace': 'ns1'}}]}).encode('utf-8')),
+            (200, json.dumps({'metadata': {},
+                              'items': [{'metadata': {'name': 'b', 'namespace': 'ns2'}}]}).encode('utf-8')),
+        ]
+
+        success, count, has_errors, error_msg = kdiff_cli.fetch_single_resource_api(
+            proxy, 'test-context', 'configmap', None, self.test_dir,
+            lambda x, keep_metadata=False: x, False, False, self.print_lock
+        )
+
+        self.assertTrue(success)
+        self.assertEqual(count, 2)
+        self.assertEqual(proxy.get.call_args_list[1][0][0], '/api/v1/configmaps?limit=500&continue=tok%2F1')
+        self.assertTrue((self.test_dir / 'configmap__ns1__a.json').exists())
+        self.assertTrue((self.test_dir / 'configmap__ns2__b.json').exists())
+
+    def test_api_fetch_streams_pages(self):
+        """Test that streamed pages are parsed item by item, continue token included."""
+        if kdiff_cli.ijson is None:
+            self.skipTest("ijson not installed")
+        proxy = MagicMock()
+        proxy.resource_info.side_effect = lambda kind: (*kdiff_cli.RESOURCE_API[kind], True)
+        proxy.get.side_effect = [
+            (200, io.BytesIO(json.dumps({'metadata': {'continue': 'tok'}, 'items': [
+                {'metadata': {'name': 'a', 'namespace': 'ns1', 'managedFields': [{'manager': 'kubectl'}],
+                              'annotations': {'kubectl.kubernetes.io/last-applied-configuration': '{"kind":"ConfigMap"}',
+                                              'team': 'web'}},
+                 'data': {'n': {'x': [1, 2.5]}}, 'status': {'phase': 'Active'}}
+            ]}).encode('utf-8'))),
+            (200, io.BytesIO(json.dumps({'metadata': {}, 'items': [
+                {'metadata': {'name': 'b', 'namespace': 'ns1'}}
+            ]}).encode('utf-8'))),
+        ]
+
+        success, count, has_errors, error_msg = kdiff_cli.fetch_single_resource_api(
+            proxy, 'test-context', 'configmap', None, self.test_dir,
+            lambda x, keep_metadata=False: x, False, False, self.print_lock
+        )
+
+        self.assertTrue(success)
+        self.assertEqual(count, 2)
+        self.assertEqual(proxy.get.call_args_list[1][0][0], '/api/v1/configmaps?limit=500&continue=tok')
+        written = json.loads((self.test_dir / 'configmap__ns1__a.json').read_text(encoding='utf-8'))
+        self.assertEqual(written['data'], {'n': {'x': [1, 2.5]}})
+        # Fields that normalize() drops are skipped while parsing
+        self.assertEqual(written['metadata'], {'name': 'a', 'namespace': 'ns1', 'annotations': {'team': 'web'}})
+        self.assertNotIn('status', written)
+        self.assertEqual(written['kind'], 'ConfigMap')
+
+    def test_api_fetch_forbidden_is_not_critical(self):
+        """Test that HTTP 403 is reported as a non-critical permission error."""
+        proxy = MagicMock()
+        proxy.resource_info.side_effect = lambda kind: (*kdiff_cli.RESOURCE_API[kind], True)
+        proxy.get.return_value = (403, b'secrets is forbidden')
+
+        success, count, has_errors, error_msg = kdiff_cli.fetch_single_resource_api(
+            proxy, 'test-context', 'secret', None, self.test_dir,
+            lambda x, keep_metadata=False: x, False, False, self.print_lock
+        )
+
+        proxy.get.assert_called_once_with('/api/v1/secrets?limit=500', stream=kdiff_cli.ijson is not None)
+        self.assertTrue(success)
+        self.assertEqual(count, 0)
+        self.assertTrue(has_errors)
+        self.assertIsNone(error_msg)
+
+    @patch('kdiff_cli.KubectlProxy')
+    def test_shared_proxy_is_reused_and_left_open(self, mock_proxy_class):
+        """Test that namespace fetches share the caller's proxy instead of starting their own."""
+        proxy = MagicMock()
+        proxy.resource_info.side_effect = lambda kind: (*kdiff_cli.RESOURCE_API[kind], True)
+        proxy.get.return_value = (200, json.dumps({'items': []}).encode('utf-8'))
+
+        for ns in ('ns1', 'ns2'):
+            success = fetch_resources('test-context', self.test_dir / ns, ['deployment'], ns,
+                                      single_cluster_mode=True, proxy=proxy)
+            self.assertTrue(success)
+
+        mock_proxy_class.assert_not_called()
+        proxy.close.assert_not_called()
+        self.assertEqual(proxy.get.call_count, 2)
+
+    def test_proxy_startup_timeout_and_stderr(self):
+        """Test that a silent proxy is killed after the deadline and stderr never blocks it."""
+        silent = 'import time; time.sleep(60)'
+        # More stderr than a pipe buffer holds before the address line
+        chatty = ('import sys, time; sys.stderr.write("w" * 200000 + "\\n"); sys.stderr.flush(); '
+                  'print("Starting to serve on 127.0.0.1:12345", flush=True); time.sleep(60)')
+
+        with patch.object(kdiff_cli, 'kubectl_cmd', return_value=[sys.executable, '-c', silent]), \
+                patch.object(kdiff_cli, 'PROXY_START_TIMEOUT', 0.5):
+            start = time.monotonic()
+            with self.assertRaisesRegex(RuntimeError, 'did not start within'):
+                kdiff_cli.KubectlProxy('test-context')
+            self.assertLess(time.monotonic() - start, 10)
+
+        with patch.object(kdiff_cli, 'kubectl_cmd', return_value=[sys.executable, '-c', chatty]):
+            proxy = kdiff_cli.KubectlProxy('test-context')
+            try:
+                self.assertEqual(proxy.port, 12345)
+            finally:
+                proxy.close()
+
+    def test_api_discovery_resolves_custom_resources(self):
+        """Test that types outside RESOURCE_API are resolved once through API discovery."""
+        responses = {
+            '/api/v1': {'resources': [
+                {'name': 'nodes', 'kind': 'Node', 'namespaced': False, 'verbs': ['get', 'list']},
+                {'name': 'pods/log', 'kind': 'Pod', 'namespaced': True, 'verbs': ['get']},
+            ]},
+            '/apis': {'groups': [{'preferredVersion': {'groupVersion': 'example.com/v1'}}]},
+            '/apis/example.com/v1': {'resources': [
+                {'name': 'widgets', 'singularName': 'widget', 'kind': 'Widget',
+                 'namespaced': True, 'shortNames': ['wg'], 'verbs': ['list']},
+            ]},
+        }
+        proxy = kdiff_cli.KubectlProxy.__new__(kdiff_cli.KubectlProxy)
+        proxy._discovery = None
+        proxy._discovery_lock = Lock()
+        proxy.get = MagicMock(side_effect=lambda path: (200, json.dumps(responses[path]).encode('utf-8')))
+
+        widget = ('example.com/v1', 'Widget', 'widgets', True)
+        self.assertEqual(proxy.resource_info('widget'), widget)
+        self.assertEqual(proxy.resource_info('wg'), widget)
+        self.assertEqual(proxy.resource_info('Widgets'), widget)
+        self.assertEqual(proxy.resource_info('node'), ('v1', 'Node', 'nodes', False))
+        self.assertIsNone(proxy.resource_info('unknown'))
+        self.assertEqual(proxy.get.call_count, 3)
+        self.assertEqual(kdiff_cli.resource_api_path(widget, 'default'),
+                         '/apis/example.com/v1/namespaces/default/widgets')
+        self.assertEqual(kdiff_cli.resource_api_path(('v1', 'Node', 'nodes', False), 'default'), '/api/v1/nodes')
+
+
+class TestBatchFetch(unittest.TestCase):
+    """Test batched fetching of several resource types with one kubectl call."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.test_dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        """Clean up test fixtures."""
+        if self.test_dir.exists():
+            shutil.rmtree(self.test_dir)
+
+    @patch('kdiff_cli.subprocess.run')
+    @patch('kdiff_cli.load_normalize_func')
+    def test_batch_uses_single_call_and_item_kind(self, mock_normalize, mock_run):
+        """Test that batched types are fetched together and files are named by item kind."""
+        result = MagicMock()
+        result.returncode = 0
+        result.stderr = ""
+        result.stdout = json.dumps({
+            'items': [
+                {'kind': 'Deployment', 'metadata': {'name': 'web', 'namespace': 'default'}},
+                {'kind': 'ConfigMap', 'metadata': {'name': 'cfg', 'namespace': 'default'}},
+            ]
+        })
+        mock_run.return_value = result
+        mock_normalize.return_value = lambda x, keep_metadata=False: x
+
+        success = fetch_resources('test-context', self.test_dir, ['deployment', 'configmap'],
+                                  'default', batch=True)
+
+        self.assertTrue(success)
+        self.assertEqual(mock_run.call_count, 1)
+        cmd = mock_run.call_args[0][0]
+        self.assertEqual(cmd[cmd.index('get') + 1], 'deployment,configmap')
+        self.assertTrue((self.test_dir / 'deployment__default__web.json').exists())
+        self.assertTrue((self.test_dir / 'configmap__default__cfg.json').exists())
+
+    @patch('kdiff_cli.subprocess.run')
+    @patch('kdiff_cli.load_normalize_func')
+    def test_batch_is_split_across_parallel_calls(self, mock_normalize, mock_run):
+        """Test that long type lists are sharded and large types land in different calls."""
+        result = MagicMock()
+        result.returncode = 0
+        result.stderr = ""
+        result.stdout = json.dumps({'items': []})
+        mock_run.return_value = result
+        mock_normalize.return_value = lambda x, keep_metadata=False: x
+
+        success = fetch_resources('test-context', self.test_dir, kdiff_cli.RESOURCES, 'default', batch=True)
+
+        self.assertTrue(success)
+        batches = [c[0][0][c[0][0].index('get') + 1].split(',') for c in mock_run.call_args_list]
+        self.assertEqual(len(batches), 3)
+        self.assertEqual(sorted(k for b in batches for k in b), sorted(kdiff_cli.RESOURCES))
+        for kinds in batches:
+            self.assertLessEqual(len(kinds), kdiff_cli.BATCH_MAX_KINDS)
+            self.assertLessEqual(len(set(kinds) & {'secret', 'configmap'}), 1)
+
+        # Few types but three large ones: still one large type per call
+        mock_run.reset_mock()
+        small_batch = ['deployment', 'configmap', 'secret', 'pod', 'role']
+        self.assertTrue(fetch_resources('test-context', self.test_dir, small_batch, 'default', batch=True))
+        batches = [c[0][0][c[0][0].index('get') + 1].split(',') for c in mock_run.call_args_list]
+        self.assertEqual(len(batches), 3)
+        self.assertEqual(sorted(k for b in batches for k in b), sorted(small_batch))
+        for kinds in batches:
+            self.assertLessEqual(len(set(kinds) & set(kdiff_cli.LARGE_PAYLOAD_RESOURCES)), 1)
+
+    @patch('kdiff_cli.subprocess.run')
+    @patch('kdiff_cli.load_normalize_func')
+    def test_batch_falls_back_to_per_type_calls(self, mock_normalize, mock_run):
+        """Test that a non-critical failure of the combined call retries each type."""
+        def mock_kubectl(cmd, *args, **kwargs):
+            kind = cmd[cmd.index('get') + 1]
+            result = MagicMock()
+            if ',' in kind or kind == 'secret':
+                result.returncode = 1
+                result.stderr = 'Error from server (Forbidden): secrets is forbidden'
+                result.stdout = ""
+            else:
+                result.returncode = 0
+                result.stderr = ""
+                result.stdout = json.dumps({
+                    'items': [{'metadata': {'name': 'res', 'namespace': 'default'}}]
+                })
+            return result
+
+        mock_run.side_effect = mock_kubectl
+        mock_normalize.return_value = lambda x, keep_metadata=False: x
+
+        success = fetch_resources('test-context', self.test_dir, ['role', 'secret'],
+                                  'default', batch=True)
+
+        self.assertTrue(success)
+        # One combined call plus one call per type
+        self.assertEqual(mock_run.call_count, 3)
+        self.assertTrue((self.test_dir / 'role__default__res.json').exists())
+
 
 class TestThreadSafety(unittest.TestCase):
     """Test thread safety of shared resources."""
@@ -344,6 +751,35 @@ class TestThreadSafety(unittest.TestCase):
             if test_dir.exists():
                 shutil.rmtree(test_dir)
 
+    def test_pending_writes_are_bounded(self):
+        """Test that a slow disk makes normalization wait instead of queueing every file."""
+        from threading import BoundedSemaphore
+        test_dir = Path(tempfile.mkdtemp())
+        real_write = kdiff_cli.write_file
+        written = []
+        max_pending = []
+
+        def slow_write(*args, **kwargs):
+            time.sleep(0.005)
+            real_write(*args, **kwargs)
+            written.append(1)
+
+        def items():
+            for i in range(40):
+                max_pending.append(i - len(written))
+                yield {'metadata': {'name': f'cm-{i}', 'namespace': 'default'}}
+
+        try:
+            with patch.object(kdiff_cli, 'write_file', slow_write), \
+                    patch.object(kdiff_cli, 'WRITE_SLOTS', BoundedSemaphore(2)):
+                count = kdiff_cli.write_items(items(), lambda item: 'configmap', test_dir,
+                                              lambda x, keep_metadata=False: x, False, False)
+            self.assertEqual(count, 40)
+            self.assertEqual(len(list(test_dir.glob('*.json'))), 40)
+            self.assertLessEqual(max(max_pending), 2)
+        finally:
+            shutil.rmtree(test_dir)
+
 
 if __name__ == '__main__':
     unittest.main()